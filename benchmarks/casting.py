@@ -0,0 +1,98 @@
+# encoding: utf-8
+
+"""
+Compares casting a large response into a `Report` against the
+previous approach of casting every cell on its own, with dates
+parsed by `dateutil`, into a list of named tuples.
+
+    python benchmarks/casting.py [rows]
+"""
+
+import collections
+import random
+import sys
+import timeit
+
+from dateutil.parser import parse
+
+import googleanalytics as ga
+from googleanalytics.columns import Column, ColumnList
+
+
+COLUMNS = [
+    Column('ga:date', 'dimension', format=ga.columns.DIMENSIONS['ga:date']),
+    Column('ga:pagePath', 'dimension'),
+    Column('ga:pageviews', 'metric', format=int),
+    Column('ga:sessions', 'metric', format=int),
+    Column('ga:avgTimeOnPage', 'metric', format=float),
+]
+
+# the way dates and cells used to be cast
+CASTERS = {
+    'ga:date': lambda date: parse(date).date(),
+    'ga:pagePath': ga.utils.unicode,
+    'ga:pageviews': int,
+    'ga:sessions': int,
+    'ga:avgTimeOnPage': float,
+}
+
+
+class API(object):
+    all_columns = ColumnList(COLUMNS)
+    has_metadata = True
+
+    @property
+    def metadata(self):
+        return self
+
+    def lookup(self, fn):
+        return fn(self)
+
+
+class Query(object):
+    api = API()
+
+
+def response(n):
+    rows = []
+    for i in range(n):
+        rows.append([
+            '201407{:02d}'.format(i % 30 + 1),
+            '/page/{}'.format(random.randint(0, n // 10)),
+            str(random.randint(0, 10000)),
+            str(random.randint(0, 1000)),
+            repr(random.random() * 100),
+        ])
+
+    return {
+        'columnHeaders': [{'name': column.id} for column in COLUMNS],
+        'rows': rows,
+        'query': {'start-date': '2014-07-01', 'end-date': '2014-07-30'},
+        'totalsForAllResults': {'ga:pageviews': '0', 'ga:sessions': '0', 'ga:avgTimeOnPage': '0'},
+    }
+
+
+def baseline(raw):
+    Row = collections.namedtuple('Row', [column.python_slug for column in COLUMNS])
+    casters = [CASTERS[column.id] for column in COLUMNS]
+    rows = []
+    for row in raw['rows']:
+        typed_row = [casters[i](row[i]) for i in range(len(COLUMNS))]
+        rows.append(Row(*typed_row))
+    return rows
+
+
+def columnar(raw):
+    return ga.query.Report(raw, Query())
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    raw = response(n)
+    assert list(columnar(raw).rows) == baseline(raw)
+
+    before = min(timeit.repeat(lambda: baseline(raw), number=1, repeat=3))
+    after = min(timeit.repeat(lambda: columnar(raw), number=1, repeat=3))
+    print("{} rows".format(n))
+    print("per cell:   {:.3f}s".format(before))
+    print("per column: {:.3f}s ({:.1f}x faster)".format(after, before / after))
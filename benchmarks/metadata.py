@@ -0,0 +1,89 @@
+# encoding: utf-8
+
+"""
+Compares hydrating column metadata with lazy template columns against
+the previous approach of expanding every template column, like
+`ga:dimensionXX`, into all of its instances up front and concatenating
+them with `reduce(operator.add)` and looking up columns by scanning
+every index. Reports the time it takes to build the column list, the
+memory it takes up and the time a lookup takes.
+
+    python benchmarks/metadata.py
+"""
+
+import functools
+import operator
+import timeit
+import tracemalloc
+
+import addressable
+
+import googleanalytics as ga
+from googleanalytics.columns import Column, ColumnList
+
+
+# templates in the core reporting API and how many columns they stand in for
+TEMPLATES = [
+    ('ga:dimensionXX', 'dimension', 'Custom Dimension XX', 200),
+    ('ga:metricXX', 'metric', 'Custom Metric XX Value', 200),
+    ('ga:contentGroupXX', 'dimension', 'Page Group XX', 5),
+    ('ga:landingContentGroupXX', 'dimension', 'Landing Page Group XX', 5),
+    ('ga:previousContentGroupXX', 'dimension', 'Previous Page Group XX', 5),
+    ('ga:nextContentGroupXX', 'dimension', 'Next Page Group XX', 5),
+    ('ga:contentGroupUniqueViewsXX', 'metric', 'Unique Views XX', 5),
+    ('ga:customVarNameXX', 'dimension', 'Custom Variable (Key XX)', 50),
+    ('ga:customVarValueXX', 'dimension', 'Custom Variable (Value XX)', 50),
+    ('ga:calcMetric_XX', 'metric', 'Calculated Metric XX', 50),
+] + [
+    ('ga:goalXX' + suffix, 'metric', 'Goal XX ' + suffix, 20) for suffix in
+    ['Starts', 'Completions', 'Value', 'ConversionRate', 'Abandons', 'AbandonRate']
+]
+
+
+def metadata(plain=450):
+    items = []
+    for i in range(plain):
+        kind = 'metric' if i % 3 else 'dimension'
+        items.append({'id': 'ga:column{}x'.format(chr(97 + i % 26) * (i // 26 + 1)), 'attributes': {
+            'type': kind.upper(), 'dataType': 'INTEGER', 'uiName': 'Column {}'.format(i)}})
+    for id, kind, name, size in TEMPLATES:
+        items.append({'id': id, 'attributes': {
+            'type': kind.upper(), 'dataType': 'STRING', 'uiName': name,
+            'minTemplateIndex': '1', 'maxTemplateIndex': str(size)}})
+    return items
+
+
+def eager(items):
+    columns = [Column.from_metadata(item).expand() for item in items]
+    return ColumnList(functools.reduce(operator.add, columns), unique=False)
+
+
+def lazy(items):
+    return ga.metadata.hydrate(items, unique=False).all_columns
+
+
+def scan(columns, key):
+    return addressable.List.get(columns, key)
+
+
+def find(columns, key):
+    return columns.get(key)
+
+
+def measure(fn, get, items):
+    tracemalloc.start()
+    columns = fn(items)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    duration = min(timeit.repeat(lambda: fn(items), number=1, repeat=5))
+    lookup = min(timeit.repeat(lambda: get(columns, 'ga:dimension137'), number=100, repeat=3)) / 100
+    return len(columns), duration, size, lookup
+
+
+if __name__ == '__main__':
+    items = metadata()
+    assert scan(eager(items), 'Custom Dimension 137').id == find(lazy(items), 'Custom Dimension 137').id
+    for label, fn, get in [('eager', eager, scan), ('lazy', lazy, find)]:
+        n, duration, size, lookup = measure(fn, get, items)
+        print("{:<6} {:>5} columns, {:.3f}s to build, {:.1f} MB, {:.1f}µs per lookup".format(
+            label, n, duration, size / 2.0 ** 20, lookup * 10 ** 6))
@@ -2,7 +2,7 @@
 
 import pkg_resources
 
-from . import auth, commands, tests, utils, account, auth, blueprint, columns, errors, query, segments
+from . import auth, commands, tests, utils, account, aggregate, auth, blueprint, cache, columns, errors, metadata, query, segments, storage, writers
 from .auth import authenticate, authorize, revoke
 from .blueprint import Blueprint
 
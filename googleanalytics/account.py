@@ -4,14 +4,15 @@
 """
 
 import functools
+import threading
 
-import yaml
+import httplib2
 import addressable
 
 from . import utils
 from . import query
-from . import columns
-from .columns import Column, Segment, ColumnList, SegmentList
+from . import metadata
+from .cache import MemoryCache
 
 
 class Account(object):
@@ -32,6 +33,13 @@ class Account(object):
     report = profile.core.query('pageviews').range('2014-10-01', '2014-10-31').get()
     print(report['pageviews'])
     ```
+
+    Web properties and profiles are fetched once and then cached on
+    the objects they belong to. To fetch them again:
+
+    ```python
+    ga.utils.invalidate(account)
+    ```
     """
 
     def __init__(self, raw, service, credentials):
@@ -41,6 +49,36 @@ class Account(object):
         self.id = raw['id']
         self.name = raw['name']
         self.permissions = raw['permissions']['effective']
+        self._owner = threading.current_thread()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        """
+        The HTTP connection to use for API requests from the current thread.
+
+        `httplib2` connections are not thread-safe: the thread that
+        authenticated keeps using the connection that comes with
+        `service` (`None` tells the API client to use it), any other
+        thread gets an authorized connection of its own.
+        """
+
+        if threading.current_thread() is self._owner:
+            return None
+
+        if not hasattr(self._local, 'http'):
+            self._local.http = self.oauth.authorize(httplib2.Http())
+
+        return self._local.http
+
+    @property
+    @utils.memoize
+    def oauth(self):
+        """
+        OAuth credentials shared by the connections of all threads,
+        so that an access token only needs to be refreshed once.
+        """
+        return self.credentials.oauth
 
     @property
     @utils.memoize
@@ -142,6 +180,7 @@ class Profile(object):
         self.account = webproperty.account
         self.id = raw['id']
         self.name = raw['name']
+        self.timezone = raw.get('timezone')
         self.core = CoreReportingAPI(self)
         self.realtime = RealTimeReportingAPI(self)
 
@@ -151,6 +190,16 @@ class Profile(object):
 
 
 class ReportingAPI(object):
+    # optional caching layer, e.g. `googleanalytics.cache.SQLiteCache`;
+    # set it on this class rather than on an instance to cache
+    # queries against every profile
+    cache = None
+    # queries with relative dates are cached until the day is over,
+    # in memory and for every profile
+    relative_cache = MemoryCache(size=256)
+    # transport for asynchronous queries, see `googleanalytics.aio`
+    transport = None
+
     REPORT_TYPES = {
         'ga': 'ga',
         'realtime': 'rt',
@@ -179,41 +228,51 @@ class ReportingAPI(object):
         Query = self.QUERY_TYPES[endpoint]
         self.query = Query(self)
 
-        # optional caching layer
-        self.cache = None
+    @property
+    def metadata(self):
+        return metadata.catalog.columns(self.account, self.report_type)
+
+    @property
+    def has_metadata(self):
+        """ Whether column metadata is available without fetching it first. """
+        return metadata.catalog.has('columns:' + self.report_type)
 
     @property
-    @utils.memoize
     def all_columns(self):
-        query = self.service.metadata().columns().list(
-            reportType=self.report_type
-            )
-        raw_columns = query.execute()['items']
-        hydrated_columns = utils.flatten(map(Column.from_metadata, raw_columns))
-        return ColumnList(hydrated_columns, unique=False)
+        return self.metadata.all_columns
 
     @property
-    @utils.memoize
     def columns(self):
-        return addressable.filter(columns.is_supported, self.all_columns)
+        return self.metadata.columns
 
     @property
-    @utils.memoize
     def segments(self):
-        query = self.service.management().segments().list()
-        raw_segments = query.execute()['items']
-        hydrated_segments = [Segment(raw, self) for raw in raw_segments]
-        return SegmentList(hydrated_segments)
+        return metadata.catalog.segments(self.account)
+
+    def lookup(self, fn):
+        """
+        Look up columns with `fn`, which is passed the `Metadata` for
+        this report type. Metadata that is out of date, like the snapshot
+        that comes with this package, doesn't know about columns that
+        have been added since, so when `fn` raises a `KeyError`, metadata
+        is fetched again and `fn` gets another try.
+        """
+        current = self.metadata
+        try:
+            return fn(current)
+        except KeyError:
+            latest = metadata.catalog.columns(self.account, self.report_type, fresh=True)
+            if latest is current:
+                raise
+            return fn(latest)
 
     @property
-    @utils.memoize
     def metrics(self):
-        return addressable.filter(columns.is_metric, self.columns)
+        return self.metadata.metrics
 
     @property
-    @utils.memoize
     def dimensions(self):
-        return addressable.filter(columns.is_dimension, self.columns)
+        return self.metadata.dimensions
 
     @property
     @utils.memoize
@@ -237,8 +296,12 @@ class RealTimeReportingAPI(ReportingAPI):
     # base class, but the Real Time Reporting API is still in beta and some
     # things – like a metadata endpoint – are missing.
     @property
-    @utils.memoize
-    def all_columns(self):
-        raw_columns = yaml.load(open(utils.here('realtime.yml')))
-        hydrated_columns = utils.flatten(map(Column.from_metadata, raw_columns))
-        return ColumnList(hydrated_columns)
+    def metadata(self):
+        return metadata.catalog.realtime
+
+    @property
+    def has_metadata(self):
+        return True
+
+    def lookup(self, fn):
+        return fn(self.metadata)
@@ -0,0 +1,184 @@
+# encoding: utf-8
+
+"""
+Local aggregation of metrics, used to merge the results of
+sharded queries into a single report and to roll up reports.
+
+Additive metrics are summed. Calculated metrics (ratios and averages
+like `ga:bounceRate` or `ga:avgSessionDuration`) are recomputed from
+their components when those are part of the same report. Any other
+metric that is not additive, like a count of unique users, can only
+be carried over for groups that consist of a single row; for other
+groups its value is unknown and the metric is flagged. (Values for
+groups of a single row are always carried over as-is.)
+"""
+
+import ast
+import operator
+import re
+
+from . import columns, storage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Python 2 and 3 compatibility
+try:
+    Number = ast.Constant
+except AttributeError:
+    Number = ast.Num
+
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.USub: operator.neg,
+}
+
+
+def evaluate(node, values):
+    if isinstance(node, ast.Expression):
+        return evaluate(node.body, values)
+    elif isinstance(node, ast.BinOp):
+        left = evaluate(node.left, values)
+        right = evaluate(node.right, values)
+        return OPERATORS[type(node.op)](left, right)
+    elif isinstance(node, ast.UnaryOp):
+        return OPERATORS[type(node.op)](evaluate(node.operand, values))
+    elif isinstance(node, ast.Name):
+        return values[node.id]
+    elif isinstance(node, Number):
+        return getattr(node, 'value', getattr(node, 'n', None))
+    else:
+        raise ValueError("Unsupported operation in metric calculation.")
+
+
+def formula(column):
+    """
+    Compile the calculation of a calculated metric, e.g.
+    `ga:bounces / ga:sessions`, into a list of the columns
+    it depends on and a function that takes the values for
+    those columns, in that same order.
+    """
+
+    calculation = column.attributes['calculation'].replace('XX', str(column.index))
+    components = []
+
+    def name(match):
+        components.append(match.group(0))
+        return '_{}'.format(len(components) - 1)
+
+    expression = re.sub(r'\w+:\w+', name, calculation)
+    tree = ast.parse(expression, mode='eval')
+    # calculations describe a fraction, but percentages
+    # are reported on a scale from 0 to 100
+    scale = 100 if column.attributes.get('dataType') == 'PERCENT' else 1
+
+    def calculate(*values):
+        names = {'_{}'.format(i): value for i, value in enumerate(values)}
+        try:
+            return evaluate(tree, names) * scale
+        except ZeroDivisionError:
+            return 0.0
+
+    return components, calculate
+
+
+def group(keys):
+    """
+    Assign every key to a group, in order of appearance.
+    Returns the group number for every key and the unique keys.
+    """
+
+    groups = {}
+    unique = []
+    indices = []
+    for key in keys:
+        index = groups.get(key)
+        if index is None:
+            index = groups[key] = len(unique)
+            unique.append(key)
+        indices.append(index)
+    return indices, unique
+
+
+def total(values, indices, size):
+    """
+    Sum values by group. Columns in typed arrays are summed
+    with NumPy when it is installed, anything else in Python.
+    """
+
+    typecode = storage.typecode(values)
+    if numpy is not None and typecode and len(values):
+        vector = numpy.frombuffer(values, dtype=typecode)
+        groups = numpy.fromiter(indices, dtype=numpy.intp, count=len(values))
+        if typecode == 'd':
+            return numpy.bincount(groups, weights=vector, minlength=size).tolist()
+        else:
+            totals = numpy.zeros(size, dtype=vector.dtype)
+            numpy.add.at(totals, groups, vector)
+            return totals.tolist()
+
+    totals = [0] * size
+    for i, value in zip(indices, values):
+        totals[i] += value
+    return totals
+
+
+def carry(values, indices, size):
+    """ Keep values for groups of one row, use `None` for any other group. """
+    counts = [0] * size
+    carried = [None] * size
+    for i, value in zip(indices, values):
+        counts[i] += 1
+        carried[i] = value
+    return [value if count == 1 else None for value, count in zip(carried, counts)]
+
+
+def aggregate(keys, metrics, values):
+    """
+    Aggregate metric values by key.
+
+    `keys` is a sequence with one hashable key per row, `metrics` a list of
+    metric columns and `values` a list with a sequence of values per metric.
+
+    Returns the unique keys, a list with the aggregated values for each
+    metric and a list of the ids of metrics that could not be aggregated.
+    """
+
+    indices, unique = group(keys)
+    size = len(unique)
+    ids = [metric.id for metric in metrics]
+    aggregated = {}
+    flagged = []
+
+    for metric, series in zip(metrics, values):
+        if columns.is_additive(metric):
+            aggregated[metric.id] = total(series, indices, size)
+
+    for metric, series in zip(metrics, values):
+        if metric.id in aggregated:
+            continue
+
+        aggregated[metric.id] = carried = carry(series, indices, size)
+        if None not in carried:
+            continue
+
+        components = None
+        if columns.is_calculated(metric):
+            components, calculate = formula(metric)
+
+        if components and all(component in aggregated for component in components):
+            inputs = [aggregated[component] for component in components]
+            for i, row in enumerate(zip(*inputs)):
+                if carried[i] is None:
+                    carried[i] = calculate(*row)
+        else:
+            flagged.append(metric.id)
+
+    return unique, [aggregated[id] for id in ids], flagged
@@ -0,0 +1,270 @@
+# encoding: utf-8
+
+"""
+Asynchronous execution of queries, for use with `asyncio`.
+Requires Python 3.6 or later.
+
+```python
+report = await query.aget()
+
+async for page in query.apages():
+    print(page.rows)
+```
+
+Requests go through a transport. By default, the regular HTTP client
+runs in a thread pool, which keeps the event loop free but ties up a
+thread for every request that is in flight. With `aiohttp` installed,
+`AiohttpTransport` makes requests without any threads at all:
+
+```python
+ga.account.ReportingAPI.transport = ga.aio.AiohttpTransport()
+```
+
+Rate limiting works the same as for synchronous queries, using
+the same buckets, except that waiting for a token doesn't block.
+"""
+
+import asyncio
+from functools import partial
+
+import httplib2
+
+from . import utils
+
+
+class ExecutorTransport(object):
+    """
+    Execute requests with the regular, blocking HTTP client in
+    an executor: the event loop's default thread pool, unless
+    you pass in an executor of your own.
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor
+
+    def _execute(self, request, query):
+        return request.execute(http=query.account.http)
+
+    async def execute(self, request, query):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self._execute, request, query))
+
+
+class AiohttpTransport(object):
+    """
+    Execute requests with `aiohttp`, for when hundreds of
+    requests should be in flight at the same time.
+    """
+
+    def __init__(self, session=None, limit=100):
+        self.session = session
+        self.limit = limit
+
+    async def execute(self, request, query):
+        import aiohttp
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        # refreshing an access token is rare enough to do it
+        # with the regular client, outside of the event loop
+        credentials = query.account.oauth
+        if credentials.access_token is None or credentials.access_token_expired:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, credentials.refresh, httplib2.Http())
+
+        headers = dict(request.headers)
+        credentials.apply(headers)
+
+        async with self.session.request(
+                request.method, request.uri, data=request.body, headers=headers) as response:
+            content = await response.read()
+            info = dict(response.headers)
+            info['status'] = str(response.status)
+
+        # the request knows how to turn the response into a
+        # dictionary and raises an `HttpError` if it is an error
+        return request.postproc(httplib2.Response(info), content)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class StubTransport(object):
+    """
+    Answer requests locally, without making any HTTP requests,
+    which is useful for tests. `respond` takes a query and returns
+    a response or an exception to raise. Keeps track of the queries
+    it answers and of how many were in flight at the same time.
+    """
+
+    def __init__(self, respond, delay=0):
+        self.respond = respond
+        self.delay = delay
+        self.queries = []
+        self.active = 0
+        self.peak = 0
+
+    async def execute(self, request, query):
+        self.queries.append(query)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+
+        response = self.respond(query)
+        if isinstance(response, Exception):
+            raise response
+        else:
+            return response
+
+
+DEFAULT_TRANSPORT = ExecutorTransport()
+
+
+class AsyncQuery(object):
+    """ Asynchronous counterparts to `Query#fetch`, `Query#execute` and `Query#get`. """
+
+    @property
+    def transport(self):
+        return self.api.transport or DEFAULT_TRANSPORT
+
+    async def afetch(self):
+        # caches, like `SQLiteCache`, read from and write to disk,
+        # which shouldn't hold up the event loop
+        loop = asyncio.get_event_loop()
+        cached = self._cache()[0] is not None
+        response = None
+        if cached:
+            response = await loop.run_in_executor(None, self._lookup)
+
+        if response is None:
+            request = self._request()
+            attempt = 0
+            while response is None:
+                await asyncio.sleep(self.limiter.reserve())
+                try:
+                    response = await self.transport.execute(request, self)
+                except Exception as err:
+                    err = self._failed(err)
+                    if not self._retry(err, attempt):
+                        raise err
+                    await asyncio.sleep(utils.retry.backoff(attempt))
+                    attempt = attempt + 1
+            self.limiter.speed_up()
+            if cached:
+                await loop.run_in_executor(None, self._store, response)
+
+        return response
+
+    async def aexecute(self):
+        from .query import Report
+        return Report(await self.afetch(), self)
+
+    async def aget(self):
+        return await self._run().aexecute()
+
+    async def apages(self, window=4):
+        yield await self._run().aexecute()
+
+
+class AsyncCoreQuery(AsyncQuery):
+    async def aget(self):
+        """
+        Run the query and return a `Report`, like `CoreQuery#get`.
+        All pages after the first are fetched concurrently.
+        """
+
+        query = self._run()
+
+        if 'shard' in query.meta:
+            report = await query._aget_sharded()
+        else:
+            report = await query.aexecute()
+            cursors = list(query.pages(report.raw[0].get('totalResults', 0)))
+            if cursors and not report.is_complete:
+                responses = await asyncio.gather(*[cursor.afetch() for cursor in cursors])
+                for cursor, response in zip(cursors, responses):
+                    report.append(response, cursor)
+
+        if query.meta.get('dense'):
+            return report.expand()
+        else:
+            return report
+
+    async def apages(self, window=4):
+        """
+        Iterate over the pages of a query, each page a `Report`
+        of its own, in order. While you're working on one page,
+        up to `window` of the next pages are already being fetched.
+        """
+
+        from .query import Report
+
+        query = self._run()
+        if 'shard' in query.meta or query.meta.get('dense'):
+            # like `CoreQuery#iter_rows`, these need every page first
+            yield await query.aget()
+            return
+
+        first = await query.aexecute()
+        yield first
+
+        if first.is_complete:
+            return
+
+        cursors = iter(query.pages(first.raw[0].get('totalResults', 0)))
+        pending = []
+        try:
+            while True:
+                for cursor in cursors:
+                    pending.append((cursor, asyncio.ensure_future(cursor.afetch())))
+                    if len(pending) >= window:
+                        break
+
+                if not pending:
+                    break
+
+                cursor, future = pending.pop(0)
+                yield Report(await future, cursor)
+        finally:
+            for cursor, future in pending:
+                future.cancel()
+
+    async def _aget_sharded(self):
+        from .query import merge
+
+        if not ('start_date' in self.raw and 'end_date' in self.raw):
+            raise ValueError("Cannot shard a query without a date range.")
+
+        raw = self.build()
+        base = self.clone()
+        interval = base.meta.pop('shard')
+        base.meta.pop('dense', None)
+        ranges = utils.date.split(raw['start_date'], raw['end_date'], interval)
+        shards = [base.range(start, stop) for start, stop in ranges]
+        reports = await asyncio.gather(*[shard._aget_unsampled() for shard in shards])
+        # merging may have to fetch metadata first, which
+        # shouldn't hold up the event loop either
+        loop = asyncio.get_event_loop()
+        executor = getattr(self.transport, 'executor', None)
+        return await loop.run_in_executor(executor, merge, utils.flatten(reports))
+
+    async def _aget_unsampled(self):
+        report = await self.aget()
+        raw = self.build()
+        start = raw['start_date']
+        stop = raw['end_date']
+
+        if report.is_sampled and start != stop:
+            halves = [self.range(*half) for half in utils.date.bisect(start, stop)]
+            reports = await asyncio.gather(*[half._aget_unsampled() for half in halves])
+            return utils.flatten(reports)
+        else:
+            return [report]
@@ -0,0 +1,221 @@
+# encoding: utf-8
+
+"""
+Caching of raw API responses, keyed by `Query#signature`.
+
+Any object with `get(key)` and `set(key, value, ttl=None)` methods can
+serve as a cache, `get` returning `None` when it doesn't have a response.
+To cache responses for queries against every profile, set the cache on
+the `ReportingAPI` class:
+
+```python
+import googleanalytics as ga
+ga.account.ReportingAPI.cache = ga.cache.SQLiteCache('~/.cache/googleanalytics.db')
+```
+
+Queries for date ranges that include today are never cached. Data for
+the last couple of days may still change as well, so if you query
+recent date ranges, consider a `ttl` (in seconds).
+
+Queries with relative dates like `yesterday` or `7daysAgo` are cached
+separately, in `ReportingAPI.relative_cache`: a `MemoryCache` with
+entries that expire when the day is over.
+"""
+
+import collections
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+
+class SQLiteCache(object):
+    """
+    A persistent cache in an SQLite database, which can be shared
+    by multiple threads and processes. Responses are stored as
+    compressed JSON. Responses expire after `ttl` seconds (or never,
+    by default) and when the cache grows beyond `size` bytes, the
+    least recently used responses are evicted. When a response was
+    last used is only kept up to date to within `resolution` seconds.
+    """
+
+    def __init__(self, path='~/.cache/googleanalytics/responses.db', ttl=None, size=256 * 2 ** 20, resolution=60):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.size = size
+        self.resolution = resolution
+        self.local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # SQLite connections cannot be shared between threads
+    # or across a fork, so each thread and process gets its own
+    @property
+    def connection(self):
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        now = time.time()
+        # always exhaust cursors: an unfinished statement keeps
+        # a stale read snapshot around, which would stop this
+        # connection from writing to the database later on
+        rows = self.connection.execute(
+            'SELECT value, expires, accessed FROM responses WHERE key = ?', (key, )).fetchall()
+
+        if not rows:
+            return None
+
+        value, expires, accessed = rows[0]
+        if expires is not None and expires < now:
+            self.delete(key)
+            return None
+
+        # eviction only needs a rough idea of when a response was last
+        # used, so most reads don't have to wait for the write lock
+        if now - accessed > self.resolution:
+            self.connection.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(zlib.decompress(value).decode('utf-8'))
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = ttl or self.ttl
+        if ttl:
+            expires = now + ttl
+        else:
+            expires = None
+
+        blob = zlib.compress(json.dumps(value).encode('utf-8'))
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(blob), len(blob), expires, now))
+            self.evict(now)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def evict(self, now):
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM responses WHERE expires < ?', (now, ))
+        total = connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchall()[0][0]
+
+        if total <= self.size:
+            return
+
+        excess = total - self.size
+        evicted = []
+        for key, size in connection.execute(
+                'SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            evicted.append((key, ))
+            excess = excess - size
+            if excess <= 0:
+                break
+
+        connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM responses WHERE key = ?', (key, ))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM responses')
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM responses').fetchall()[0][0]
+
+    def __repr__(self):
+        return "<googleanalytics.cache.SQLiteCache object: {}>".format(self.path)
+
+
+class MemoryCache(object):
+    """
+    A bounded, in-memory cache that holds on to at most `size`
+    responses, evicting the least recently used response first.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, size=256, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                return None
+
+            # move to the end, as the most recently used
+            self.entries[key] = entry
+
+        # responses are mutable, so never hand out the cached copy
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        if ttl:
+            expires = time.time() + ttl
+        else:
+            expires = None
+
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "<googleanalytics.cache.MemoryCache object: {}/{} responses>".format(
+            len(self), self.size)
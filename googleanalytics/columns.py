@@ -1,5 +1,6 @@
 # encoding: utf-8
 
+import datetime
 import functools
 import re
 
@@ -19,11 +20,28 @@ TYPES = {
     'CURRENCY': float,
 }
 
+# dates always come in the same format, e.g. `20140701` or `2014070113`,
+# which is a lot faster to parse by hand than with `dateutil`
 DIMENSIONS = {
-    'ga:date': lambda date: utils.date.parse(date).date(),
-    'ga:dateHour': lambda date: utils.date.parse('{} {}'.format(date[:8], date[8:])),
+    'ga:date': lambda date: datetime.date(int(date[:4]), int(date[4:6]), int(date[6:8])),
+    'ga:dateHour': lambda date: datetime.datetime(int(date[:4]), int(date[4:6]), int(date[6:8]), int(date[8:10])),
 }
 
+# metrics that count distinct users, which cannot be added up across
+# dates or dimension values because the same user may show up in both
+UNIQUE_COUNTS = (
+    'ga:users',
+    'ga:1dayUsers',
+    'ga:7dayUsers',
+    'ga:14dayUsers',
+    'ga:28dayUsers',
+    'ga:30dayUsers',
+    'rt:activeUsers',
+)
+
+# full column ids, which can be used without looking them up
+QUALIFIED = re.compile(r'^(ga|rt):\w+$')
+
 def escape_chars(value, chars=',;'):
     if value is True:
         return 'Yes'
@@ -62,32 +80,50 @@ class Column(object):
 
     @classmethod
     def from_metadata(cls, metadata):
+        """
+        A column from the metadata API. Template columns, like `ga:goalXXCompletions`,
+        stay a single column, which stands in for all of its instances, see `expand`.
+        """
         attributes = metadata['attributes']
         data_format = DIMENSIONS.get(metadata['id']) or TYPES.get(attributes['dataType']) or utils.identity
         is_deprecated = attributes.get('status', 'ACTIVE') == 'DEPRECATED'
         is_allowed_in_segments = 'allowedInSegments' in attributes
-        column = Column(metadata['id'],
+        return Column(metadata['id'],
             column_type=attributes['type'].lower(),
             format=data_format,
             attributes=attributes,
             deprecated=is_deprecated,
             allowed_in_segments=is_allowed_in_segments,
             )
-        return column.expand()
+
+    @classmethod
+    def from_header(cls, header):
+        """
+        A column from a column header in an API response, which has its
+        id and data type but none of the other metadata, like its name.
+        """
+        data_format = DIMENSIONS.get(header['name']) or TYPES.get(header['dataType']) or utils.identity
+        return Column(header['name'],
+            column_type=header['columnType'].lower(),
+            format=data_format,
+            attributes={'type': header['columnType'], 'dataType': header['dataType']},
+            )
 
     def __init__(self, column_id, column_type, format=utils.unicode, attributes={},
             deprecated=False, allowed_in_segments=True):
         self.account = None
         self.id = column_id
         self.report_type, self.slug = self.id.split(':')
-        index = re.search(r'\d{1,2}', self.slug)
+        index = re.search(r'\d+', self.slug)
         if index:
             self.index = int(index.group(0))
         else:
             self.index = None
         self.python_slug = snakify(self.slug)
         self.attributes = attributes
-        self.name = attributes.get('uiName', column_id).replace('XX', str(self.index))
+        self.name = attributes.get('uiName', column_id)
+        if self.index is not None:
+            self.name = self.name.replace('XX', str(self.index))
         self.group = attributes.get('group')
         self.description = attributes.get('description')
         self.type = column_type
@@ -95,28 +131,68 @@ class Column(object):
         self.cast = format
         self.is_deprecated = deprecated
         self.is_allowed_in_segments = allowed_in_segments
+        self.is_template = 'XX' in self.id
+        if self.is_template:
+            self.range = (
+                int(attributes.get('minTemplateIndex', '1')),
+                int(attributes.get('maxTemplateIndex', '20')),
+                )
+            # `snakify` lowercases `XX`
+            self.patterns = [template(self.id), template(self.slug),
+                template(self.name), template(self.python_slug, 'xx')]
+            self.instances = {}
 
     def link(self, account):
         self.account = account
 
+    def match(self, key):
+        """
+        For template columns, the index of the column that `key`
+        refers to, e.g. 12 for `Goal 12 Completions`, or `None`.
+        """
+        for pattern in self.patterns:
+            match = pattern.match(key)
+            if match:
+                index = int(match.group(1))
+                if self.range[0] <= index <= self.range[1]:
+                    return index
+        return None
+
+    def instantiate(self, index):
+        """ The column with this index for a template column, like `ga:goal12Completions`. """
+        column = self.instances.get(index)
+        if column is None:
+            column = Column(self.id.replace('XX', str(index)),
+                column_type=self.type,
+                format=self.cast,
+                attributes=self.attributes,
+                deprecated=self.is_deprecated,
+                allowed_in_segments=self.is_allowed_in_segments,
+                )
+            if getattr(self, 'frozen', False):
+                column.freeze()
+            column = self.instances.setdefault(index, column)
+        return column
+
+    def freeze(self):
+        """
+        Columns are shared by all profiles, see `googleanalytics.metadata`,
+        so once they've been set up, they cannot be changed.
+        """
+        object.__setattr__(self, 'frozen', True)
+        return self
+
+    def __setattr__(self, name, value):
+        if getattr(self, 'frozen', False):
+            raise AttributeError("Cannot change {} of {}: columns are shared and immutable.".format(name, self.id))
+        object.__setattr__(self, name, value)
+
     def expand(self):
-        columns = []
-        if 'XX' in self.id:
-            min_index = int(self.attributes.get('minTemplateIndex', '1'))
-            max_index = int(self.attributes.get('maxTemplateIndex', '20'))
-            for i in range(min_index, max_index + 1):
-                column = Column(self.id.replace('XX', str(i)),
-                    column_type=self.type,
-                    format=self.cast,
-                    attributes=self.attributes,
-                    deprecated=self.is_deprecated,
-                    allowed_in_segments=self.is_allowed_in_segments,
-                    )
-                columns.append(column)
+        """ Every column a template column stands in for, or just the column itself. """
+        if self.is_template:
+            return [self.instantiate(i) for i in range(self.range[0], self.range[1] + 1)]
         else:
-            columns = [self]
-
-        return columns
+            return [self]
 
     @escape
     def eq(self, value):
@@ -217,6 +293,14 @@ class Goal(object):
 
 
 class ColumnList(addressable.List):
+    """
+    Columns that can be looked up by name, id, slug or Python slug.
+
+    Template columns like `ga:dimensionXX` are a single item in the list,
+    and columns like `ga:dimension37` or `Custom Dimension 37` are only
+    created once they're looked up.
+    """
+
     COLUMN_TYPE = Column
 
     def __init__(self, columns, **options):
@@ -225,6 +309,33 @@ class ColumnList(addressable.List):
         options['indices'] = ('name', 'id', 'slug', 'python_slug')
         options['insensitive'] = True
         super(ColumnList, self).__init__(**options)
+        self.templates = [column for column in self if getattr(column, 'is_template', False)]
+        # exact matches, which take precedence in the same order as
+        # they would when scanning the indices one after the other
+        self.exact = {}
+        for index in self.indices:
+            for key, column in index.items():
+                self.exact.setdefault(key, column)
+
+    def get(self, key, default=None):
+        if not isinstance(key, utils.basestring) or self.fuzzy:
+            return super(ColumnList, self).get(key, default)
+
+        column = self.exact.get(key.lower())
+        if column is None:
+            column = self.resolve(key)
+        if column is None:
+            return default
+        else:
+            return self.facet(column)
+
+    def resolve(self, key):
+        """ The instance of a template column that `key` refers to, if any. """
+        for column in self.templates:
+            index = column.match(key)
+            if index is not None:
+                return column.instantiate(index)
+        return None
 
     @utils.vectorize
     def normalize(self, value):
@@ -254,6 +365,13 @@ class ColumnList(addressable.List):
             return value
 
 
+def template(value, placeholder='XX'):
+    # a pattern that matches a value of a template column,
+    # e.g. `Goal XX Completions`, for any index
+    parts = [re.escape(part) for part in value.split(placeholder)]
+    return re.compile('^' + r'(\d+)'.join(parts) + '$', re.IGNORECASE)
+
+
 class SegmentList(ColumnList):
     COLUMN_TYPE = Segment
 
@@ -270,6 +388,30 @@ def is_metric(column):
 def is_dimension(column):
     return column.type == 'dimension'
 
+def is_qualified(value, report_type=None):
+    """
+    Whether a string is a full column id, like `ga:pageviews`,
+    for the report type `ga` or `rt` if one is given.
+    """
+    if not isinstance(value, utils.basestring):
+        return False
+    match = QUALIFIED.match(value)
+    return match is not None and report_type in (None, match.group(1))
+
+def is_calculated(column):
+    return 'calculation' in column.attributes
+
+def is_additive(column):
+    """
+    Additive metrics can be summed across dates and dimension
+    values; ratios, averages and counts of unique users cannot.
+    """
+    return is_metric(column) \
+        and not is_calculated(column) \
+        and column.attributes.get('dataType') != 'PERCENT' \
+        and not column.slug.startswith('avg') \
+        and column.id not in UNIQUE_COUNTS
+
 def is_core(column):
     return column.report_type == 'ga'
 
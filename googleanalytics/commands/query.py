@@ -88,7 +88,7 @@ def from_args(scope, metrics,
     default='total',
     help='Return hourly, daily etc. numbers.')
 @click.option('-o', '--output',
-    type=click.Choice(['csv', 'json', 'ascii']),
+    type=click.Choice(['csv', 'ndjson', 'json', 'ascii', 'arrow', 'parquet']),
     default='ascii',
     help='Output format; human-readable ascii table by default.')
 @click.option('--with-metadata',
@@ -98,8 +98,11 @@ def from_args(scope, metrics,
 @click.option('--realtime',
     is_flag=True,
     help='Use the RealTime API instead of the Core API.')
+@click.option('--cache',
+    type=click.Path(dir_okay=False),
+    help='Cache responses in an SQLite database at this path.')
 @click.pass_obj
-def query(scope, blueprint, debug, output, with_metadata, realtime, **description):
+def query(scope, blueprint, debug, output, with_metadata, realtime, cache, **description):
     """
     e.g.
 
@@ -114,6 +117,9 @@ def query(scope, blueprint, debug, output, with_metadata, realtime, **descriptio
     if realtime:
         description['type'] = 'realtime'
 
+    if cache:
+        ga.account.ReportingAPI.cache = ga.cache.SQLiteCache(cache)
+
     if blueprint:
         queries = from_blueprint(scope, blueprint)
     else:
@@ -126,5 +132,9 @@ def query(scope, blueprint, debug, output, with_metadata, realtime, **descriptio
         if debug:
             click.echo(query.build())
 
-        report = query.serialize(format=output, with_metadata=with_metadata)
-        click.echo(report)
+        if output in ga.writers.WRITERS:
+            # streaming formats are written page by page
+            query.write(click.get_binary_stream('stdout'), output)
+        else:
+            report = query.serialize(format=output, with_metadata=with_metadata)
+            click.echo(report)
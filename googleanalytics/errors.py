@@ -1,7 +1,72 @@
 # encoding: utf-8
 
+import json
+
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+QUOTA_REASONS = ('dailyLimitExceeded', 'quotaExceeded')
+
+
+def content(err):
+    try:
+        return json.loads(err.content.decode('utf-8'))['error']
+    except (AttributeError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def reason(err):
+    """
+    The reason the Google Analytics API gives for an `HttpError`,
+    e.g. `rateLimitExceeded`, or `None` for any other error.
+    """
+    if isinstance(err, GoogleAnalyticsError):
+        return err.reason
+
+    try:
+        return content(err)['errors'][0]['reason']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def classify(err):
+    """
+    Turn an `HttpError` into a `LimitExceededError`, `ServerError`,
+    `NotPermittedError` or `InvalidRequestError`, and mark it as
+    `transient` if trying again later might help. Any other
+    error is returned as-is.
+    """
+
+    status = getattr(getattr(err, 'resp', None), 'status', None)
+    if status is None:
+        return err
+
+    status = int(status)
+    why = reason(err)
+    # the API uses 403 Forbidden for rate limits as well
+    # as for permissions, so look at the reason first
+    if why in RATE_LIMIT_REASONS or why in QUOTA_REASONS or status == 429:
+        cls = LimitExceededError
+    elif status >= 500:
+        cls = ServerError
+    elif status in (401, 403):
+        cls = NotPermittedError
+    elif status == 400:
+        cls = InvalidRequestError
+    else:
+        return err
+
+    error = cls(content(err).get('message') or str(err))
+    error.status = status
+    error.reason = why
+    error.transient = why in RATE_LIMIT_REASONS or status == 429 or status >= 500
+    return error
+
+
 class GoogleAnalyticsError(Exception):
-    pass
+    # HTTP status code and reason as reported by the API, if any
+    status = None
+    reason = None
+    transient = False
 
 
 class InvalidRequestError(GoogleAnalyticsError):
@@ -21,4 +86,4 @@ class LimitExceededError(GoogleAnalyticsError):
 
 class ServerError(GoogleAnalyticsError):
     # internal server error / backend error
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,309 @@
+# encoding: utf-8
+
+"""
+Metadata about columns and segments, shared by every profile in the
+process and persisted to disk, so that it is only fetched once rather
+than once for every profile.
+
+Columns are fetched again when they are older than `ttl` seconds,
+with the etag of the metadata we have, so that the API only sends
+all of the columns again when they have changed. Segments, which
+belong to a user rather than to a profile, are fetched again after
+`ttl` seconds as well.
+
+Metadata that is out of date is still used while it's fetched again
+in the background. Only when there is no metadata at all do queries
+have to wait for it.
+
+This package comes with a snapshot of column metadata, which is used
+until there's anything more recent, so scripts that run for only a
+short while don't have to fetch metadata before they can run a query.
+It always has the columns of the real time reporting API, which doesn't
+have a metadata endpoint, and has the columns of the core reporting API
+once `make snapshot` has been run with credentials and its result
+committed. The core columns are never written by hand: their types
+and calculations determine how values are cast and merged. Columns
+that aren't part of the snapshot yet are fetched when they're needed,
+see `ReportingAPI#lookup`, except for columns with a full id, like
+`ga:pageviews`, which never wait for metadata.
+
+As long as metadata doesn't change, the same `Column` objects are
+shared by all profiles, which is why columns cannot be modified.
+
+To keep metadata somewhere else, or only in memory:
+
+```python
+import googleanalytics as ga
+ga.metadata.catalog.path = '/tmp/metadata.json'
+ga.metadata.catalog.path = None
+```
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+import addressable
+
+from . import columns, utils
+from .columns import Column, ColumnList, Segment, SegmentList
+
+
+# column lists for a report type, as on `ReportingAPI`
+Metadata = collections.namedtuple('Metadata', ['all_columns', 'columns', 'metrics', 'dimensions'])
+
+
+def hydrate(items, unique=True):
+    all_columns = ColumnList([Column.from_metadata(item) for item in items], unique=unique)
+    for column in all_columns:
+        column.freeze()
+    supported = addressable.filter(columns.is_supported, all_columns)
+    return Metadata(
+        all_columns,
+        supported,
+        addressable.filter(columns.is_metric, supported),
+        addressable.filter(columns.is_dimension, supported),
+        )
+
+
+# metadata that comes with this package
+SNAPSHOT = utils.here('snapshot.json')
+
+
+@utils.memoize
+def bundled():
+    try:
+        with open(SNAPSHOT) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def snapshot(service, path=SNAPSHOT):
+    """
+    Save the columns of the core reporting API, fetched with `service`,
+    and those of the real time reporting API, from `realtime.yml`, to
+    the snapshot that comes with this package.
+    """
+
+    import yaml
+
+    response = service.metadata().columns().list(reportType='ga').execute()
+    with open(utils.here('realtime.yml')) as f:
+        realtime = yaml.safe_load(f)
+
+    entries = {
+        'columns:ga': {'etag': response.get('etag'), 'items': response['items'], 'checked': time.time()},
+        'columns:rt': {'items': realtime},
+        }
+    with open(path, 'w') as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+
+
+def status(err):
+    try:
+        return int(err.resp.status)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class Catalog(object):
+    """
+    Column and segment metadata for every profile in the process,
+    saved as JSON to `path` (unless it is `None`) and fetched again
+    from the API when it is older than `ttl` seconds.
+    """
+
+    def __init__(self, path='~/.cache/googleanalytics/metadata.json', ttl=24 * 60 * 60, background=True):
+        self.path = path
+        self.ttl = ttl
+        self.background = background
+        self.lock = threading.RLock()
+        self.loaded = None
+        # raw metadata, as it is saved to disk
+        self.entries = {}
+        # columns and segments for the raw metadata
+        self.hydrated = {}
+        # metadata that is being fetched in the background
+        self.refreshing = set()
+
+    def fresh(self, entry):
+        return self.ttl is None or time.time() - entry['checked'] < self.ttl
+
+    def columns(self, account, report_type, fresh=False):
+        """
+        Metadata for the columns of a report type, like `ga`.
+        With `fresh`, metadata that is out of date, like the
+        bundled snapshot, is fetched again before it is returned.
+        """
+
+        def fetch(entry):
+            request = account.service.metadata().columns().list(reportType=report_type)
+            if entry and entry.get('etag'):
+                request.headers['If-None-Match'] = entry['etag']
+            try:
+                response = request.execute(http=account.http)
+            except Exception as err:
+                if entry and status(err) == 304:
+                    return entry
+                raise
+            return {'etag': response.get('etag'), 'items': response['items']}
+
+        return self.get('columns:' + report_type, fetch, lambda items: hydrate(items, unique=False), fresh)
+
+    def segments(self, account):
+        """ The segments available to the user an account belongs to. """
+
+        def fetch(entry):
+            request = account.service.management().segments().list()
+            return {'items': request.execute(http=account.http)['items']}
+
+        def hydrate_segments(items):
+            segments = SegmentList([Segment(raw, None) for raw in items])
+            for segment in segments:
+                segment.freeze()
+            return segments
+
+        key = 'segments:' + utils.unicode(account.credentials.identity)
+        return self.get(key, fetch, hydrate_segments)
+
+    @property
+    @utils.memoize
+    def realtime(self):
+        """
+        Metadata for the Real Time Reporting API, which doesn't
+        have a metadata endpoint, from the bundled snapshot.
+        """
+        return hydrate(bundled()['columns:rt']['items'])
+
+    def has(self, key):
+        """ Whether there is metadata for `key` that doesn't need to be fetched first. """
+        if key in self.hydrated:
+            return True
+        with self.lock:
+            self.load()
+            return key in self.entries or key in bundled()
+
+    def get(self, key, fetch, build, fresh=False):
+        hydrated = self.hydrated.get(key)
+        if hydrated and self.fresh(hydrated[0]):
+            return hydrated[1]
+
+        with self.lock:
+            self.load()
+            entry = self.entries.get(key)
+            if entry is None and key in bundled():
+                # the snapshot is as fresh as when it was taken,
+                # and when it's out of date it will do for now
+                entry = self.entries[key] = dict(bundled()[key])
+                entry.setdefault('checked', 0)
+
+            if entry is None:
+                entry = self.refresh(key, fetch, entry)
+            elif not self.fresh(entry):
+                if self.background and not fresh:
+                    self.refresh_later(key, fetch, entry)
+                else:
+                    entry = self.refresh(key, fetch, entry)
+
+            # keep handing out the same objects as long
+            # as the metadata they're made of hasn't changed
+            hydrated = self.hydrated.get(key)
+            if hydrated and (hydrated[0] is entry or hydrated[0]['items'] == entry['items']):
+                value = hydrated[1]
+            else:
+                value = build(entry['items'])
+            self.hydrated[key] = (entry, value)
+            return value
+
+    def refresh(self, key, fetch, entry):
+        entry = dict(fetch(entry), checked=time.time())
+        with self.lock:
+            self.entries[key] = entry
+            self.save()
+        return entry
+
+    def refresh_later(self, key, fetch, entry):
+        if key in self.refreshing:
+            return
+        self.refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(key, fetch, entry)
+            except Exception:
+                # we'll try again the next time metadata is needed
+                pass
+            finally:
+                self.refreshing.discard(key)
+
+        thread = threading.Thread(target=run, name='googleanalytics-metadata')
+        thread.daemon = True
+        thread.start()
+
+    def load(self):
+        path = self.path and os.path.expanduser(self.path)
+        if self.loaded == path:
+            return
+        self.loaded = path
+
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (IOError, OSError, TypeError, ValueError):
+            return
+
+        for key, entry in saved.items():
+            if key not in self.entries:
+                self.entries[key] = entry
+
+    def save(self):
+        if not self.path:
+            return
+
+        path = os.path.expanduser(self.path)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            # replace the file in one go, so other processes
+            # never read metadata that's only partially written
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except (IOError, OSError):
+            # metadata can always be fetched again
+            pass
+
+    def invalidate(self):
+        """ Forget all metadata, in memory and on disk. """
+        with self.lock:
+            self.entries = {}
+            self.hydrated = {}
+            if self.path:
+                try:
+                    os.remove(os.path.expanduser(self.path))
+                except (IOError, OSError):
+                    pass
+
+
+catalog = Catalog()
+
+
+def main():
+    """
+    Refresh the snapshot, see `make snapshot`. This needs credentials,
+    because the columns of the core reporting API have to be fetched.
+    """
+
+    from . import auth
+    try:
+        accounts = auth.authenticate()
+    except KeyError as err:
+        raise SystemExit("Cannot refresh the snapshot without credentials. {}".format(err))
+    if not accounts:
+        raise SystemExit("Cannot refresh the snapshot: these credentials have no Google Analytics accounts.")
+    snapshot(accounts[0].service)
@@ -4,13 +4,14 @@
 """
 
 import collections
-import csv
 from datetime import datetime
 import hashlib
+import io
 import json
 import time
-from copy import deepcopy
+from copy import copy, deepcopy
 from functools import partial
+from multiprocessing.pool import ThreadPool
 
 import addressable
 import inspector
@@ -18,8 +19,14 @@ import yaml
 from dateutil.relativedelta import relativedelta
 import prettytable
 
-from . import errors, utils
-from .columns import Column, ColumnList, Segment
+from . import aggregate, errors, storage, utils, writers
+from .columns import Column, ColumnList, Segment, is_additive, is_calculated, is_qualified
+
+try:
+    from .aio import AsyncQuery, AsyncCoreQuery
+except SyntaxError:
+    # asynchronous queries require Python 3.6 or later
+    AsyncQuery = AsyncCoreQuery = object
 
 
 INTERVAL_TIMEDELTAS = {
@@ -30,6 +37,56 @@ INTERVAL_TIMEDELTAS = {
     'date_hour': dict(hours=1),
 }
 
+# the NumPy unit for dimensions that contain dates
+DATE_UNITS = {
+    'ga:date': 'datetime64[D]',
+    'ga:dateHour': 'datetime64[h]',
+}
+
+# weeks start on Sunday and the first week of the year
+# is the one that contains January 1st
+def week(date):
+    offset = (date.replace(month=1, day=1).weekday() + 1) % 7
+    return (date.timetuple().tm_yday - 1 + offset) // 7 + 1
+
+
+# the names of the time dimensions reports can be rolled up into,
+# for reports that don't have their metadata, see `Report#rollup`
+TIME_DIMENSIONS = {
+    'ga:date': 'Date',
+    'ga:yearWeek': 'Week of Year',
+    'ga:yearMonth': 'Month of Year',
+    'ga:year': 'Year',
+}
+
+def time_column(column_id):
+    return Column.from_metadata({'id': column_id, 'attributes': {
+        'type': 'DIMENSION',
+        'dataType': 'STRING',
+        'group': 'Time',
+        'status': 'PUBLIC',
+        'uiName': TIME_DIMENSIONS[column_id],
+        }}).freeze()
+
+
+# the value of each time dimension for an hour or a day
+PERIODS = {
+    'date_hour': lambda dt: dt,
+    'date': lambda dt: dt.date(),
+    'year_week': lambda dt: '{:04d}{:02d}'.format(dt.year, week(dt)),
+    'year_month': lambda dt: dt.strftime('%Y%m'),
+    'year': lambda dt: dt.strftime('%Y'),
+}
+
+# the calendar interval that corresponds to each time dimension
+GRANULARITY_INTERVALS = {
+    'year': 'year',
+    'year_month': 'month',
+    'year_week': 'week',
+    'date': 'day',
+    'date_hour': 'day',
+}
+
 def path(l, *keys):
     indexed = {}
     for el in l:
@@ -49,6 +106,56 @@ def default(metric):
         return 0
 
 
+# column lists and row classes, shared between reports with the same columns
+Schema = collections.namedtuple('Schema', ['source', 'columns', 'metrics', 'dimensions', 'granularity', 'Row'])
+SCHEMAS = {}
+SCHEMAS_LIMIT = 1000
+
+def schema(ids, source):
+    """
+    The column list, metrics, dimensions, time dimension and row class
+    for reports with the columns `ids`, looked up in the column list
+    `source`. These are built once for every set of columns and then
+    shared, so they should not be modified.
+    """
+
+    # custom dimensions and metrics have the same ids across properties,
+    # but not the same names, so schemas are specific to a column list
+    key = (id(source), tuple(ids))
+    cached = SCHEMAS.get(key)
+    if cached and cached.source is source:
+        return cached
+
+    columns = ColumnList([source[column] for column in ids])
+    metrics = addressable.filter(lambda column: column.type == 'metric', columns)
+    dimensions = addressable.filter(lambda column: column.type == 'dimension', columns)
+    time_columns = ['date_hour', 'date', 'year_week', 'year_month', 'year']
+    try:
+        granularity = next(column for column in dimensions if column.python_slug in time_columns)
+    except StopIteration:
+        granularity = None
+    # named tuples have no `__dict__`, so rows are as compact as plain tuples
+    Row = collections.namedtuple('Row', [column.python_slug for column in columns])
+
+    if len(SCHEMAS) >= SCHEMAS_LIMIT:
+        SCHEMAS.clear()
+    SCHEMAS[key] = cached = Schema(source, columns, metrics, dimensions, granularity, Row)
+    return cached
+
+
+# column lists built from the column headers of API responses
+HEADERS = {}
+
+def header_columns(headers):
+    key = tuple((header['name'], header['columnType'], header['dataType']) for header in headers)
+    columns = HEADERS.get(key)
+    if columns is None:
+        if len(HEADERS) >= SCHEMAS_LIMIT:
+            HEADERS.clear()
+        columns = HEADERS[key] = ColumnList([Column.from_header(header) for header in headers])
+    return columns
+
+
 class Report(object):
     """
     Executing a query will return a report, which contains the requested data.
@@ -68,6 +175,8 @@ class Report(object):
     ```
 
     You can access the data in a Report object both rowwise and columnwise.
+    Reports store their data by column, in typed arrays, and only
+    create row objects as you access them.
 
     ```python
     report = query.metrics('pageviews', 'sessions').range('yesterday')
@@ -78,6 +187,13 @@ class Report(object):
     report.rows[:10]['sessions']
     ```
 
+    `report.rows` is a read-only sequence rather than a list. To
+    change the rows of a report, assign a new list of rows to it:
+
+    ```python
+    report.rows = list(report.rows) + extra
+    ```
+
     For simple data structures, there are also some shortcuts.
 
     These shortcuts are available both directly on Report objects
@@ -100,19 +216,24 @@ class Report(object):
         self.raw = []
         self.queries = []
 
-        all_columns = query.api.all_columns
-        report_columns = [column['name'] for column in raw['columnHeaders']]
-        self.columns = ColumnList([all_columns[column] for column in report_columns])
-        self.metrics = addressable.filter(lambda column: column.type == 'metric', self.columns)
-        self.dimensions = addressable.filter(lambda column: column.type == 'dimension', self.columns)
-        time_columns = ['date_hour', 'date', 'year_week', 'year_month', 'year']
-        try:
-            self.granularity = next(column for column in self.dimensions if column.python_slug in time_columns)
-        except StopIteration:
-            self.granularity = None
-        slugs = [column.python_slug for column in self.columns]
-        self.Row = collections.namedtuple('Row', slugs)
-        self.rows = []
+        headers = raw['columnHeaders']
+        ids = [header['name'] for header in headers]
+        self.source = None
+        if query.api.has_metadata:
+            source = query.api.metadata.all_columns
+            try:
+                self._configure(schema(ids, source))
+                self.source = source
+            except KeyError:
+                pass
+        if self.source is None:
+            # rather than wait for metadata, or fetch it again because
+            # it doesn't know about some of the columns yet, cast values
+            # using the data types in the column headers
+            self._configure(schema(ids, header_columns(headers)))
+        self.data = [storage.empty(column) for column in self.columns]
+        self.flagged = []
+        self._indexes = (None, 0, {})
         self.append(raw, query)
 
         self.since = self.until = None
@@ -123,25 +244,171 @@ class Report(object):
         if 'end-date' in raw['query']:
             self.until = datetime.strptime(raw['query']['end-date'], '%Y-%m-%d')
 
+    def save(self, path):
+        """
+        Save the report to a file in a binary columnar format,
+        which is much faster to open than JSON. See `Report.open`.
+        """
+        self._resolve(strict=False)
+        storage.save(self, path)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a report saved with `Report#save`. The file is memory-mapped,
+        so numeric columns are read straight from the file, and only as
+        far as they are accessed.
+
+        Reports opened from a file have no queries attached, and only
+        have metadata for their own columns, but they can be rolled up
+        like any other report.
+        """
+
+        header, columns, data = storage.load(path)
+        report = cls.__new__(cls)
+        report.raw = []
+        report.queries = []
+        report.source = ColumnList(columns)
+        report._configure(schema([column.id for column in columns], report.source))
+        report.data = data
+        report.flagged = []
+        report._indexes = (None, 0, {})
+        report.is_complete = True
+        report.totals = header['totals']
+        report.total = header['total']
+        report.since = header['since']
+        report.until = header['until']
+        return report
+
+    def _resolve(self, strict=True):
+        # reports that were built from column headers get the full
+        # metadata for their columns before they're aggregated, which
+        # needs to know which metrics are ratios or averages, and before
+        # they're serialized, so columns have the same names either way;
+        # only aggregation fails when the metadata doesn't know a column
+        if self.source is None and self.queries:
+            ids = [column.id for column in self.columns]
+            def configure(metadata):
+                self._configure(schema(ids, metadata.all_columns))
+                self.source = metadata.all_columns
+            try:
+                self.queries[0].api.lookup(configure)
+            except KeyError:
+                if strict:
+                    raise
+
+    def _configure(self, schema):
+        self.columns = schema.columns
+        self.metrics = schema.metrics
+        self.dimensions = schema.dimensions
+        self.granularity = schema.granularity
+        self.Row = schema.Row
+
     def append(self, raw, query):
         self.raw.append(raw)
         self.queries.append(query)
         self.is_complete = not 'nextLink' in raw
 
-        casters = [column.cast for column in self.columns]
-
         # if no rows were returned, the GA API doesn't
         # include the `rows` key at all
-        for row in self.raw[-1].get('rows', []):
-            typed_row = [casters[i](row[i]) for i in range(len(self.columns))]
-            typed_tuple = self.Row(*typed_row)
-            self.rows.append(typed_tuple)
+        rows = raw.get('rows', [])
+        for i, column in enumerate(self.columns):
+            values = storage.cast(column, [row[i] for row in rows])
+            self.data[i] = storage.extend(self.data[i], values)
 
         # TODO: figure out how this works with paginated queries
         self.totals = raw['totalsForAllResults']
         # more intuitive when querying for just a single metric
         self.total = list(raw['totalsForAllResults'].values())[0]
 
+    @property
+    def rows(self):
+        return storage.Rows(self)
+
+    @rows.setter
+    def rows(self, rows):
+        rows = list(rows)
+        self.data = [storage.build(column, [row[i] for row in rows])
+            for i, column in enumerate(self.columns)]
+
+    def array(self, key):
+        """
+        The values for a column as a typed array: a read-only NumPy
+        array when NumPy is installed and an `array.array` or list
+        otherwise. Unlike `report[key]`, this doesn't copy the data.
+        """
+        return storage.view(self.data[self._index(key)])
+
+    def _index(self, key):
+        if isinstance(key, Column):
+            key = key.slug
+        try:
+            return self.columns.index(key)
+        except ValueError:
+            # columns built from column headers don't have names yet
+            if self.source is None:
+                self._resolve(strict=False)
+                if self.source is not None:
+                    return self._index(key)
+            raise ValueError(key + " not in column headers")
+
+    def index(self, *keys):
+        """
+        A hash index of the rows in this report by one or more dimensions,
+        which maps their values (a tuple, or a single value when indexing on
+        a single dimension) to a list of the matching rows. Indexes are
+        built once and reused until the report changes.
+
+        ```python
+        by_page = report.index('pagepath')
+        by_page['/']
+        by_day = report.index('date', 'pagepath')
+        by_day[(datetime.date(2014, 7, 1), '/')]
+        ```
+        """
+
+        if not keys:
+            keys = [column.id for column in self.dimensions]
+        indices = tuple(self._index(key) for key in keys)
+        data, size, indexes = self._indexes
+        # reports that are appended to, expanded or rolled up
+        # get new data and therefore new indexes
+        if data is not self.data or size != len(self):
+            indexes = {}
+            self._indexes = (self.data, len(self), indexes)
+
+        index = indexes.get(indices)
+        if index is None:
+            index = indexes[indices] = storage.Index(self, [self.data[i] for i in indices])
+        return index
+
+    def lookup(self, **dimensions):
+        """
+        The row with these dimension values, or `None` if there is
+        no such row, e.g. `report.lookup(date=date, country='Belgium')`.
+        Raises a `ValueError` when several rows match, in which case
+        you probably want `Report#index` instead.
+        """
+
+        keys = sorted(dimensions)
+        index = self.index(*keys)
+        if len(keys) == 1:
+            key = dimensions[keys[0]]
+        else:
+            key = tuple(dimensions[key] for key in keys)
+        rows = index.get(key, [])
+
+        if len(rows) > 1:
+            raise ValueError("Several rows match {}, use `index` to get all of them.".format(dimensions))
+        elif rows:
+            return rows[0]
+        else:
+            return None
+
+    @property
+    def is_sampled(self):
+        return any(raw.get('containsSampledData') for raw in self.raw)
+
     @property
     def first(self):
         if len(self.rows) == 0:
@@ -176,68 +443,219 @@ class Report(object):
     # TODO: it'd be nice to have metadata from `ga` available as
     # properties, rather than only having them in serialized form
     # (so e.g. the actual metric objects with both serialized name, slug etc.)
-    def __expand(self):
-        import ranges
+    def expand(self):
+        """
+        Return a new report with a row for every hour, day, week, month
+        or year in the date range. Google Analytics leaves out rows
+        without any data, which time series usually need anyway.
 
-        # 1. generate grid
+        If the report has other dimensions, every combination of their
+        values that shows up in the report gets a row for every period.
+        Metrics in new rows are zero, except for averages, which are
+        `None`. See also `CoreQuery#dense`.
 
-        # 1a. generate date grid
-        since = self.since
-        until = self.until + relativedelta(days=1)
-        granularity = self.granularity.slug
-        dimensions = [column.slug for column in self.dimensions]
-        metrics = [column.slug for column in self.metrics]
+        ```python
+        report = query.metrics('pageviews').daily('2014-07-01', '2014-07-31').get()
+        report.expand()
+        ```
+        """
 
-        time_step = INTERVAL_TIMEDELTAS[self.granularity.slug]
-        time_ix = report.columns.index(self.granularity)
-        time_interval = (since, until)
-        time_range = list(ranges.date.range(*time_interval, **time_step))
+        if self.granularity is None or self.since is None or self.until is None:
+            raise ValueError("Can only expand reports with a date range and a time dimension.")
 
-        # 1b. generate dimension factor grid
-        factors = {dimension: set(report[dimension]) for dimension in set(dimensions) - {granularity}}
+        n = len(self.dimensions)
+        t = [column.id for column in self.columns].index(self.granularity.id)
+        others = [i for i in range(n) if i != t]
 
-        # 1c. assemble grid
-        grid = list(itertools.product(time_range, *factors.values()))
+        # the API always lists dimensions before metrics
+        keys = list(zip(*self.data[:n]))
+        index = dict(zip(keys, range(len(keys))))
+        timeline = self._timeline(set(self.data[t]))
+        if others:
+            combinations = list(collections.OrderedDict.fromkeys(
+                zip(*[self.data[i] for i in others])))
+        else:
+            combinations = [()]
+
+        # look up each row of the grid once, then fill in every column
+        grid = [combination[:t] + (time, ) + combination[t:]
+            for time in timeline for combination in combinations]
+        indices = [index.get(key) for key in grid]
+        data = [[key[i] for key in grid] for i in range(n)]
+        for metric, store in zip(self.metrics, self.data[n:]):
+            filler = default(metric.id)
+            data.append([filler if i is None else store[i] for i in indices])
+
+        report = copy(self)
+        report.data = [storage.build(column, values) for column, values in zip(self.columns, data)]
+        return report
 
-        # 2. fill in the grid with available data
-        ndim = len(self.dimensions)
-        index = path(report.rows, *report.slugs[:ndim])
+    def rollup(self, granularity=None, by=None):
+        """
+        Return a new report with the data aggregated into a coarser
+        granularity and/or fewer dimensions, without going back to the API.
+
+        `granularity` is one of `hour`, `day`, `week`, `month` or `year`,
+        or `total` to leave out the time dimension; by default, the report
+        keeps its granularity. `by` is a list of the dimensions to keep,
+        apart from time; by default, all of them.
 
-        filled = []
+        Additive metrics are summed and ratios and averages are recomputed
+        from their components, e.g. `ga:bounceRate` from `ga:bounces` and
+        `ga:sessions`, which therefore have to be part of the report.
+        Metrics that can't be rolled up, like `ga:users`, raise a `ValueError`.
 
-        for row in grid:
+        ```python
+        query = profile.core.query('pageviews', 'bounces', 'sessions', 'bounceRate')
+        report = query.dimensions('pagepath', 'browser').daily('2014-01-01', '2014-12-31').get()
+        report.rollup('month', by=['pagepath'])
+        ```
+        """
+
+        self._resolve()
+        all_columns = self.source
+        n = len(self.dimensions)
+        ids = [column.id for column in self.columns]
+
+        # reports opened from a file only have metadata for their own
+        # columns, but a coarser time dimension is derived from theirs
+        target = None
+        if granularity not in (None, 'total') and self.granularity is not None:
+            target = self._granularity_dimension(granularity)
             try:
-                # navigate to data (if it exists)
-                index_columns = row[:ndim]
-                data = index
-                for column in index_columns:
-                    data = data[column]
-                filled.append(data)
+                target = all_columns[target]
             except KeyError:
-                # TODO: for some metrics (in particular averages)
-                # the default value should be None, for most others
-                # it should be zero
-                row_metrics = [None] * len(report.metrics)
-                filler = list(row) + row_metrics
-                row = report.Row(*filler)
-                filled.append(row)
-
-        report.rows = filled
+                target = time_column(target)
+                all_columns = ColumnList(list(all_columns) + [target])
+
+        self._check_rollup()
+
+        keep = [column for column in self.dimensions if column is not self.granularity]
+        if by is not None:
+            by = set(self.columns[key].id for key in by)
+            if self.granularity is not None:
+                by.discard(self.granularity.id)
+            unknown = by - set(column.id for column in keep)
+            if unknown:
+                raise ValueError("Can only roll up by dimensions in the report, not: " + ", ".join(sorted(unknown)))
+            keep = [column for column in keep if column.id in by]
+
+        dimensions = []
+        keys = []
+        if granularity != 'total' and self.granularity is not None:
+            if granularity is None:
+                column = self.granularity
+                keys.append(self.data[ids.index(column.id)])
+            else:
+                column = target
+                keys.append(self._regroup(column))
+            dimensions.append(column)
+        elif granularity not in (None, 'total'):
+            raise ValueError("Can only roll up reports with a time dimension into a different granularity.")
+
+        dimensions.extend(keep)
+        keys.extend(self.data[ids.index(column.id)] for column in keep)
+        if keys:
+            keys = zip(*keys)
+        else:
+            keys = [()] * len(self)
+
+        unique, values, _ = aggregate.aggregate(keys, list(self.metrics), self.data[n:])
+        data = [[key[i] for key in unique] for i in range(len(dimensions))] + values
+
+        report = copy(self)
+        ids = [column.id for column in dimensions + list(self.metrics)]
+        report._configure(schema(ids, all_columns))
+        report.source = all_columns
+        report.data = [storage.build(column, values) for column, values in zip(report.columns, data)]
+        report.flagged = []
         return report
 
+    def _check_rollup(self):
+        # metrics that are neither additive nor calculated from
+        # additive metrics in the same report would be unknown
+        # for any group of more than one row
+        additive = set(column.id for column in self.metrics if is_additive(column))
+        refused = []
+        for metric in self.metrics:
+            if metric.id in additive:
+                continue
+            elif is_calculated(metric):
+                components, _ = aggregate.formula(metric)
+                if all(component in additive for component in components):
+                    continue
+            refused.append(metric.id)
+
+        if refused:
+            raise ValueError("Cannot roll up metrics that are not additive: " + ", ".join(refused))
+
+    def _granularity_dimension(self, granularity):
+        levels = CoreQuery.GRANULARITY_LEVELS
+        if granularity not in levels:
+            raise ValueError("Granularity should be one of: total, " + ", ".join(levels))
+
+        source = CoreQuery.GRANULARITY_DIMENSIONS.index(self.granularity.id)
+        target = levels.index(granularity)
+        # weeks straddle months, so they only roll up into years
+        if target > source or (self.granularity.id == 'ga:yearWeek' and granularity == 'month'):
+            raise ValueError("Cannot roll up {} into {}.".format(self.granularity.name, granularity))
+
+        return CoreQuery.GRANULARITY_DIMENSIONS[target]
+
+    def _regroup(self, column):
+        # the value for the coarser time dimension `column`
+        # for every value of the time dimension of the report
+        store = self.data[self.columns.index(self.granularity.slug)]
+        if column.id == self.granularity.id:
+            return store
+        elif self.granularity.id in DATE_UNITS:
+            period = PERIODS[column.python_slug]
+            convert = lambda value: period(value if isinstance(value, datetime)
+                else datetime.combine(value, datetime.min.time()))
+        else:
+            # weeks and months, like `201452`, roll up into years
+            convert = lambda value: value[:4]
+
+        memo = {value: convert(value) for value in set(store)}
+        return list(map(memo.__getitem__, store))
+
+    def _timeline(self, observed):
+        # every hour, day, week, month or year from `since` through `until`,
+        # in the same format as the values of the time dimension
+        slug = self.granularity.python_slug
+        start = datetime.combine(self.since.date(), datetime.min.time())
+        stop = datetime.combine(self.until.date(), datetime.min.time())
+
+        if slug == 'date_hour':
+            stop = stop + relativedelta(hours=23)
+            step = relativedelta(**INTERVAL_TIMEDELTAS['date_hour'])
+        else:
+            step = relativedelta(**INTERVAL_TIMEDELTAS['date'])
+
+        periods = set()
+        while start <= stop:
+            periods.add(PERIODS[slug](start))
+            start = start + step
+
+        # values that are part of the report but which we wouldn't
+        # otherwise have generated are kept as well
+        return sorted(periods | observed)
 
     def serialize(self, format=None, with_metadata=False):
+        self._resolve(strict=False)
         names = [column.name for column in self.columns]
 
         if not format:
             return self.as_dict(with_metadata=with_metadata)
         elif format == 'json':
             return json.dumps(self.as_dict(with_metadata=with_metadata), indent=4)
-        elif format == 'csv':
+        elif format in ('csv', 'ndjson'):
             buf = utils.StringIO()
-            writer = csv.writer(buf)
-            writer.writerow(names)
-            writer.writerows(self.rows)
+            self.write(buf, format)
+            return buf.getvalue()
+        elif format in writers.WRITERS:
+            buf = io.BytesIO()
+            self.write(buf, format)
             return buf.getvalue()
         elif format == 'ascii':
             table = prettytable.PrettyTable(names)
@@ -252,6 +670,15 @@ class Report(object):
             else:
                 return table
 
+    def write(self, sink, format='parquet'):
+        """
+        Write the report to a file-like object in `csv`, `ndjson`,
+        `arrow` or `parquet` format. See `googleanalytics.writers`.
+        """
+
+        with writers.writer(format, sink) as writer:
+            writer.write(self)
+
     def as_dict(self, with_metadata=False):
         serialized = []
         for row in self.rows:
@@ -261,6 +688,7 @@ class Report(object):
             serialized.append(row)
 
         if with_metadata:
+            self._resolve(strict=False)
             return {
                 'title': self.queries[0].title,
                 'queries': self.queries,
@@ -271,26 +699,51 @@ class Report(object):
         else:
             return serialized
 
-    def as_dataframe(self):
+    def as_dataframe(self, categorical=False):
+        """
+        A pandas DataFrame, built straight from the columns of the report.
+        Metrics become `int64` or `float64` columns and dates `datetime64`.
+
+        With `categorical=True`, dimensions that have at most half as many
+        distinct values as there are rows become categoricals. You can
+        also pass a list of the dimensions that should be categoricals.
+        """
+
+        import numpy
         import pandas
-        # passing every row as a dictionary is not terribly efficient,
-        # but it works for now
-        return pandas.DataFrame(self.as_dict())
+
+        if categorical is True:
+            categorical = [column.id for column, store in zip(self.columns, self.data)
+                if column.type == 'dimension' and len(set(store)) * 2 <= len(store)]
+        else:
+            categorical = [self.columns[key].id for key in categorical or []]
+
+        data = collections.OrderedDict()
+        for column, store in zip(self.columns, self.data):
+            if column.type == 'metric':
+                # metrics that could not be aggregated are `None`
+                if storage.typecode(store) is None:
+                    series = numpy.array(store, dtype='float64')
+                else:
+                    series = storage.view(store)
+            elif column.id in DATE_UNITS:
+                series = numpy.array(store, dtype=DATE_UNITS[column.id]).astype('datetime64[ns]')
+            elif column.id in categorical:
+                series = pandas.Categorical(store)
+            else:
+                series = numpy.array(store, dtype=object)
+            data[column.python_slug] = series
+
+        return pandas.DataFrame(data, columns=list(data.keys()))
 
     def __getitem__(self, key):
-        try:
-            if isinstance(key, Column):
-                key = key.slug
-            i = self.columns.index(key)
-            return [row[i] for row in self.rows]
-        except ValueError:
-            raise ValueError(key + " not in column headers")
+        return list(self.data[self._index(key)])
 
     def __iter__(self):
-        raise NotImplementedError()
+        return iter(self.rows)
 
     def __len__(self):
-        return len(self.rows)
+        return len(self.data[0])
 
     # TODO: would be cool if we could split up headers
     # into metrics vs. dimensions so we could say
@@ -307,6 +760,58 @@ class Report(object):
                 metrics)
 
 
+def merge(reports):
+    """
+    Merge reports for the same metrics and dimensions, but different
+    date ranges, into the first report. Rows with the same dimension
+    values are aggregated, see `googleanalytics.aggregate`.
+    """
+
+    report = reports[0]
+    report._resolve()
+    totals = [other.totals for other in reports]
+    for other in reports[1:]:
+        for raw, query in zip(other.raw, other.queries):
+            report.append(raw, query)
+    report.until = reports[-1].until
+
+    # the API always lists dimensions before metrics
+    n = len(report.dimensions)
+    metrics = list(report.metrics)
+
+    keys = list(zip(*report.data[:n])) or [()] * len(report)
+    values = report.data[n:]
+    keys, values, flagged = aggregate.aggregate(keys, metrics, values)
+    dimensions = list(zip(*keys)) or [[]] * n
+    report.data = [storage.build(column, series)
+        for column, series in zip(report.columns, dimensions + values)]
+
+    totals = [[metric.cast(total[metric.id]) for total in totals] for metric in metrics]
+    report.totals = summarize(metrics, totals)
+    report.total = report.totals[metrics[0].id]
+
+    report.flagged = flagged
+    return report
+
+
+def summarize(metrics, values):
+    """
+    Aggregate a list of values per metric into totals, formatted like
+    `totalsForAllResults` in API responses, using `None` for metrics
+    that cannot be aggregated.
+    """
+
+    size = len(values[0]) if values else 0
+    _, totals, _ = aggregate.aggregate([()] * size, metrics, values)
+    summary = {}
+    for metric, total in zip(metrics, totals):
+        value = total[0] if total else 0
+        if value is not None:
+            value = utils.unicode(value)
+        summary[metric.id] = value
+    return summary
+
+
 EXCLUSION = {
     'eq': 'neq',
     'neq': 'eq',
@@ -358,7 +863,7 @@ def select(source, selection, invert=False):
 # and removing empty keys as necessary
 # TODO: consider whether to pass everything through `Query#set`
 # or otherwise avoid having two paths to modifying `raw`
-class Query(object):
+class Query(AsyncQuery):
     """
     Return a query for certain metrics and dimensions.
 
@@ -387,8 +892,6 @@ class Query(object):
     but are not required to wrap it in a list.
     """
 
-    _lock = 0
-
     def __init__(self, api, parameters={}, metadata={}, title=None):
         self._title = title
         self.raw = {
@@ -405,14 +908,13 @@ class Query(object):
         self.account = api.profile.webproperty.account
         self._report = None
 
-    # do not execute more than one query per second
-    def _wait(self):
-        now = time.time()
-        elapsed = now - self._lock
-        wait = max(0, 1 - elapsed)
-        time.sleep(wait)
-        self._lock = time.time()
-        return wait
+    @property
+    def limiter(self):
+        """
+        The rate limiter shared by all queries against this profile
+        using the same credentials. See `googleanalytics.utils.ratelimit`.
+        """
+        return utils.ratelimit.limiter(self.account.credentials.identity, self.profile.id)
 
     @property
     def endpoint(self):
@@ -436,7 +938,12 @@ class Query(object):
         leave any other kind of value alone.
         """
 
-        serialize = partial(self.api.columns.serialize, greedy=False)
+        def serialize(value):
+            # only look up columns when there's a `Column` to serialize
+            if isinstance(value, (Column, list, tuple)):
+                return self.api.lookup(lambda metadata: metadata.columns.serialize(value, greedy=False))
+            else:
+                return value
 
         if key and value:
             self.raw[key] = serialize(value)
@@ -452,7 +959,16 @@ class Query(object):
 
     @utils.immutable
     def columns(self, required_type=None, *values):
-        for column in self.api.columns.normalize(values, wrap=True):
+        # full ids for metrics and dimensions are used as they are, whether
+        # or not there is metadata, so they never wait for it to be fetched;
+        # the API will complain about a metric that's really a dimension
+        # or about a column that doesn't exist
+        for value in values:
+            if required_type and is_qualified(value, self.api.report_type):
+                self.raw[required_type + 's'].append(value)
+                continue
+
+            column = self.api.lookup(lambda metadata: metadata.columns.normalize([value])[0])
             if required_type and required_type != column.type:
                 raise ValueError('Tried to add {type} but received: {column}'.format(
                     type=required_type,
@@ -541,7 +1057,9 @@ class Query(object):
                 identifier = column.id
             elif isinstance(column, utils.basestring):
                 descending = column.startswith('-') or options.get('descending', False)
-                identifier = self.api.columns[column.lstrip('-')].id
+                identifier = column.lstrip('-')
+                if not is_qualified(identifier, self.api.report_type):
+                    identifier = self.api.lookup(lambda metadata: metadata.columns[identifier]).id
             else:
                 raise ValueError("Can only sort on columns or column strings. Received: {}".format(column))
 
@@ -566,7 +1084,7 @@ class Query(object):
         elif value:
             value = [value]
         elif len(selection):
-            value = select(self.api.columns, selection, invert=exclude)
+            value = self.api.lookup(lambda metadata: select(metadata.columns, selection, invert=exclude))
 
         filters.append(value)
         self.raw['filters'] = utils.paste(filters, ',', ';')
@@ -588,51 +1106,207 @@ class Query(object):
         else:
             raw['dimensions'] = None
 
+        # resolve relative dates like `yesterday` the same way
+        # Google Analytics would, in the timezone of the profile
+        if self.is_relative:
+            today = utils.date.today(self.profile.timezone)
+            for key in ('start_date', 'end_date'):
+                if key in raw and utils.date.is_relative(raw[key]):
+                    date = utils.date.parse_description(raw[key], today)
+                    raw[key] = utils.date.serialize(date)
+
         return raw
 
+    @property
+    def is_relative(self):
+        dates = [self.raw[key] for key in ('start_date', 'end_date') if key in self.raw]
+        return any(map(utils.date.is_relative, dates))
+
     @property
     def cacheable(self):
-        start = 'start_date' in self.raw and not utils.date.is_relative(self.raw['start_date'])
-        end = 'end_date' in self.raw and not utils.date.is_relative(self.raw['end_date'])
-        return start and end
+        """
+        Queries for a date range are cacheable, except when that
+        range includes today (in the timezone of the profile) or
+        later, as data for the current day keeps changing.
+        """
+
+        if not ('start_date' in self.raw and 'end_date' in self.raw):
+            return False
+        else:
+            today = utils.date.today(self.profile.timezone)
+            return self.build()['end_date'] < utils.date.serialize(today)
 
     @property
     def signature(self):
-        query = self.build(copy=False)
+        query = self.build()
         standardized_query = sorted(query.items(), key=lambda t: t[0])
         serialized_query = json.dumps(standardized_query)
         return hashlib.sha1(serialized_query.encode('utf-8')).hexdigest()
 
-    def execute(self):
-        raw = self.build()
+    def _cache(self):
+        # queries with relative dates refer to different dates
+        # tomorrow, so they are only cached until midnight
+        if not self.cacheable:
+            return None, None
+        elif self.is_relative:
+            return self.api.relative_cache, utils.date.until_midnight(self.profile.timezone)
+        else:
+            return self.api.cache, None
 
-        if self.api.cache and self.cacheable and self.api.cache.exists(self.signature):
-            response = self.api.cache.get(raw)
+    def _lookup(self):
+        cache, ttl = self._cache()
+        if cache is None:
+            return None
         else:
-            try:
-                self._wait()
-                response = self.endpoint.get(**raw).execute()
-            except Exception as err:
-                if isinstance(err, TypeError):
-                    width = max(map(len, self.raw.keys()))
-                    raw = [(key.ljust(width), value) for key, value in self.raw.items()]
-                    parameters = utils.paste(raw, '\t', '\n')
-                    diagnostics = utils.format(
-                        """
-                        {message}
-
-                        The query you submitted was:
-
-                        {parameters}
-                        """, message=str(err), parameters=parameters)
-                    raise errors.InvalidRequestError(diagnostics)
-                else:
-                    raise err
+            return cache.get(self.signature)
 
-        if self.api.cache and self.cacheable:
-            self.api.cache.set(raw, response)
+    def _store(self, response):
+        cache, ttl = self._cache()
+        if cache is not None:
+            cache.set(self.signature, response, ttl=ttl)
 
-        return Report(response, self)
+    def _request(self):
+        # prepare, but don't send, the request
+        try:
+            return self.endpoint.get(**self.build())
+        except TypeError as err:
+            width = max(map(len, self.raw.keys()))
+            raw = [(key.ljust(width), value) for key, value in self.raw.items()]
+            parameters = utils.paste(raw, '\t', '\n')
+            diagnostics = utils.format(
+                """
+                {message}
+
+                The query you submitted was:
+
+                {parameters}
+                """, message=str(err), parameters=parameters)
+            raise errors.InvalidRequestError(diagnostics)
+
+    def _failed(self, err):
+        err = errors.classify(err)
+        if errors.reason(err) in errors.RATE_LIMIT_REASONS:
+            self.limiter.slow_down()
+        return err
+
+    def _retry(self, err, attempt):
+        # whether to try again after `attempt` earlier retries
+        if not getattr(err, 'transient', False):
+            return False
+        if attempt >= self.meta.get('retries', utils.retry.DEFAULTS['retries']):
+            return False
+        budget = self.meta.get('budget')
+        return budget is None or budget.spend()
+
+    def _run(self):
+        # all requests for a run share a retry budget,
+        # a new one unless the query comes with its own
+        if 'budget' in self.meta:
+            return self
+        query = self.clone()
+        query.meta['budget'] = utils.retry.Budget(utils.retry.DEFAULTS['budget'])
+        return query
+
+    @utils.immutable
+    def retry(self, retries=None, budget=None):
+        """
+        Return a new query that tries again at most `retries` times
+        when a request fails because of rate limits or server errors,
+        with jittered exponential backoff.
+
+        `budget` is the maximum amount of retries for all requests
+        in a run, or a `googleanalytics.utils.retry.Budget` to share
+        between queries. See `googleanalytics.utils.retry`.
+
+        ```python
+        query.retry(3)
+        ```
+        """
+
+        if retries is not None:
+            self.meta['retries'] = retries
+        if budget is not None:
+            if not isinstance(budget, utils.retry.Budget):
+                budget = utils.retry.Budget(budget)
+            self.meta['budget'] = budget
+        return self
+
+    def fetch(self):
+        """
+        Run the query and return the raw API response, without
+        turning it into a `Report`. Safe to call from multiple
+        threads at once.
+
+        Rate limits and server errors are retried, see `Query#retry`,
+        anything else raises a `googleanalytics.errors.GoogleAnalyticsError`
+        when the error can be classified and the original error otherwise.
+        """
+
+        response = self._lookup()
+
+        if response is None:
+            request = self._request()
+            attempt = 0
+            while response is None:
+                self.limiter.acquire()
+                try:
+                    response = request.execute(http=self.account.http)
+                except Exception as err:
+                    err = self._failed(err)
+                    if not self._retry(err, attempt):
+                        raise err
+                    time.sleep(utils.retry.backoff(attempt))
+                    attempt = attempt + 1
+            self.limiter.speed_up()
+            self._store(response)
+
+        return response
+
+    def execute(self):
+        return Report(self.fetch(), self)
+
+    def _complete(self, report, workers=4):
+        return report
+
+    def _iter_pages(self, workers=4):
+        yield self.execute()
+
+    def write(self, sink, format='parquet', workers=4):
+        """
+        Run the query and write its results to a file-like object in
+        `csv`, `ndjson`, `arrow` or `parquet` format, page by page as
+        they arrive, while later pages are still being fetched.
+        See `googleanalytics.writers`.
+
+        ```python
+        with open('pageviews.parquet', 'wb') as f:
+            query.write(f, 'parquet')
+
+        query.write(sys.stdout, 'ndjson')
+        ```
+        """
+
+        with writers.writer(format, sink) as writer:
+            for page in self._run()._iter_pages(workers):
+                writer.write(page)
+
+    def iter_rows(self, workers=4):
+        """
+        Run the query and iterate over its rows, without ever
+        building a `Report` of the full result. Pages are fetched
+        up to `workers` at a time and dropped once their rows have
+        been consumed, so memory use stays flat no matter how many
+        rows a query returns. Like `get`, this honors `limit` and `step`.
+
+        ```python
+        for row in query.iter_rows():
+            print(row.pageviews)
+        ```
+        """
+
+        for page in self._run()._iter_pages(workers):
+            for row in page.rows:
+                yield row
 
     @property
     def report(self):
@@ -658,7 +1332,7 @@ class Query(object):
         return "<googleanalytics.query.{} object: {} ({})>".format(self.__class__.__name__, self.title, self.profile.name)
 
 
-class CoreQuery(Query):
+class CoreQuery(Query, AsyncCoreQuery):
     """
     CoreQuery is the main way through which to produce reports
     from data in Google Analytics.
@@ -692,6 +1366,7 @@ class CoreQuery(Query):
     # https://developers.google.com/analytics/devguides/reporting/core/v3/reference#q_summary
 
     PRECISION_LEVELS = ('FASTER', 'DEFAULT', 'HIGHER_PRECISION', )
+    SHARD_INTERVALS = ('year', 'month', 'week', 'day', )
     GRANULARITY_LEVELS = ('year', 'month', 'week', 'day', 'hour', )
     GRANULARITY_DIMENSIONS = (
         'ga:year', 'ga:yearMonth', 'ga:yearWeek',
@@ -783,12 +1458,21 @@ class CoreQuery(Query):
         shortcut methods) you will get only a single result, encompassing the
         entire date range, per metric.
 
+        Dates relative to today, like `yesterday` or `7daysAgo`, stay
+        relative: they are resolved when the query runs, in the timezone
+        of the profile, so a query can be reused from one day to the next.
+
+        ```python
+        query.range('7daysAgo', 'yesterday')
+        ```
+
         **Note:** it is currently not possible to easily specify that you'd like
         to query the last last full week(s), month(s) et cetera.
         This will be added sometime in the future.
         """
 
-        start, stop = utils.date.range(start, stop, months, days)
+        today = utils.date.today(self.profile.timezone)
+        start, stop = utils.date.range(start, stop, months, days, today=today, relative=True)
 
         self.raw.update({
             'start_date': start,
@@ -846,6 +1530,110 @@ class CoreQuery(Query):
     def total(self, *vargs, **kwargs):
         return self.range(*vargs, **kwargs)
 
+    @utils.immutable
+    def shard(self, interval='month'):
+        """
+        Return a new query that splits its date range into shorter date
+        ranges, runs a query for each of them in parallel and merges
+        the results into a single report.
+
+        ```python
+        query.daily('2014-01-01', '2014-12-31').shard('month')
+        ```
+
+        Google Analytics samples the data for queries that span a large
+        number of sessions, and queries over a shorter date range are
+        less likely to be sampled. Shards that still contain sampled data
+        are split in half until they don't or until they span a single day.
+
+        Additive metrics are summed across shards. Ratios and averages
+        are recomputed if the metrics they're calculated from are part
+        of the query as well. Any other metric that cannot be summed,
+        like `users`, is left empty wherever its value across shards
+        cannot be known, and is listed in `Report#flagged`.
+        """
+
+        if interval not in self.SHARD_INTERVALS:
+            intervals = ", ".join(self.SHARD_INTERVALS)
+            raise ValueError("Shard interval should be one of: " + intervals)
+
+        self.meta['shard'] = interval
+        return self
+
+    def refresh(self, previous, window=2, workers=4):
+        """
+        Bring a report for this query up to date. Instead of fetching
+        everything again, only fetch what comes after the end date of
+        the `previous` report, plus its last `window` days, because the
+        most recent data may still change. The rows are then spliced
+        into a new report.
+
+        ```python
+        query = profile.core.query('pageviews').daily('2014-01-01', 'yesterday')
+        report = query.get()
+        # the next day
+        report = query.refresh(report)
+        ```
+
+        The previous report needs a time dimension. For weekly, monthly
+        or yearly reports, periods that are part of the window are
+        refetched in full.
+        """
+
+        if previous.granularity is None or previous.until is None:
+            raise ValueError("Can only refresh reports with a date range and a time dimension.")
+
+        raw = self.build()
+        interval = GRANULARITY_INTERVALS[previous.granularity.python_slug]
+        start = previous.until.date() + relativedelta(days=1 - window)
+        start = utils.date.floor(min(start, utils.date.normalize(raw['end_date'])), interval)
+
+        if start <= utils.date.normalize(raw['start_date']):
+            return self.get(workers)
+
+        report = self.range(start, raw['end_date']).get(workers)
+
+        ids = [column.id for column in report.columns]
+        if ids != [column.id for column in previous.columns]:
+            raise ValueError("Can only refresh a report with the same columns as the query.")
+
+        # rows from the previous report that fall within the range
+        # that has been fetched again are replaced, even when they
+        # didn't come back, all others are kept
+        i = ids.index(previous.granularity.id)
+        cutoff = PERIODS[previous.granularity.python_slug](datetime.combine(start, datetime.min.time()))
+        kept = [value < cutoff for value in previous.data[i]]
+
+        report.data = [storage.build(column, [value for value, keep in zip(old, kept) if keep] + list(new))
+            for column, old, new in zip(report.columns, previous.data, report.data)]
+        report.raw = previous.raw + report.raw
+        report.queries = previous.queries + report.queries
+        report.since = previous.since
+
+        metrics = list(report.metrics)
+        values = report.data[len(report.dimensions):]
+        report.totals = summarize(metrics, values)
+        report.total = report.totals[metrics[0].id]
+        return report
+
+    @utils.immutable
+    def dense(self):
+        """
+        Return a new query that fills in the rows for periods without
+        any data, which Google Analytics leaves out. See `Report#expand`.
+
+        ```python
+        query.daily('2014-07-01', '2014-07-31').dense()
+        ```
+
+        Gaps can only be filled in once every page has been fetched,
+        so `iter_rows`, `write` and `apages` fetch the whole report
+        before they start on a dense query.
+        """
+
+        self.meta['dense'] = True
+        return self
+
     @utils.immutable
     def step(self, maximum):
         """
@@ -994,7 +1782,7 @@ class CoreQuery(Query):
             if metric_scope:
                 metric_scope = SCOPES[metric_scope]
 
-            value = select(self.api.columns, selection)
+            value = self.api.lookup(lambda metadata: select(metadata.columns, selection))
             value = [[scope, 'condition', metric_scope, condition] for condition in value]
             value = ['::'.join(filter(None, condition)) for condition in value]
 
@@ -1019,7 +1807,7 @@ class CoreQuery(Query):
         self.raw['start_index'] = start
         return self
 
-    def get(self):
+    def get(self, workers=4):
         """
         Run the query and return a `Report`.
 
@@ -1028,27 +1816,132 @@ class CoreQuery(Query):
         return in a single request, or larger than the amount of rows as specified
         through `CoreQuery#step`, `get` will leaf through all pages,
         concatenate the results and produce a single Report instance.
+
+        The first page tells us how many results there are in total,
+        after which the remaining pages are fetched concurrently, using
+        at most `workers` threads. Rows are always added to the report
+        in their original order.
         """
 
-        cursor = self
-        report = None
-        is_complete = False
-        is_enough = False
+        query = self._run()
+
+        if 'shard' in query.meta:
+            report = query._get_sharded(workers)
+        else:
+            report = query._complete(query.execute(), workers)
 
-        while not (is_enough or is_complete):
-            chunk = cursor.execute()
+        if query.meta.get('dense'):
+            return report.expand()
+        else:
+            return report
 
-            if report:
-                report.append(chunk.raw[0], cursor)
-            else:
-                report = chunk
+    def _complete(self, report, workers=4):
+        # fetch the remaining pages for a report with only its first page
+        if report.is_complete:
+            return report
 
-            is_enough = len(report.rows) >= self.meta.get('limit', float('inf'))
-            is_complete = chunk.is_complete
-            cursor = cursor.next()
+        total = report.raw[0].get('totalResults', 0)
+        for cursor, response in self._fetch_pages(total, workers):
+            report.append(response, cursor)
 
         return report
 
+    def _fetch_pages(self, total, workers):
+        # fetch up to `workers` pages at a time, in order, without
+        # ever running ahead of the consumer by more than that
+        if workers <= 1:
+            for cursor in self.pages(total):
+                yield cursor, cursor.fetch()
+            return
+
+        pool = None
+        pending = collections.deque()
+        try:
+            for cursor in self.pages(total):
+                if pool is None:
+                    pool = ThreadPool(workers)
+                pending.append((cursor, pool.apply_async(cursor.fetch)))
+                if len(pending) >= workers:
+                    cursor, result = pending.popleft()
+                    yield cursor, result.get()
+            while pending:
+                cursor, result = pending.popleft()
+                yield cursor, result.get()
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def _iter_pages(self, workers=4):
+        if 'shard' in self.meta or self.meta.get('dense'):
+            # shards can only be merged, and gaps in the time
+            # dimension only filled in, once every page has been fetched
+            yield self.get(workers)
+            return
+
+        first = self.execute()
+        total = first.raw[0].get('totalResults', 0)
+        is_complete = first.is_complete
+        yield first
+        del first
+
+        if not is_complete:
+            for cursor, response in self._fetch_pages(total, workers):
+                yield Report(response, cursor)
+
+    def _get_sharded(self, workers):
+        if not ('start_date' in self.raw and 'end_date' in self.raw):
+            raise ValueError("Cannot shard a query without a date range.")
+
+        raw = self.build()
+        base = self.clone()
+        interval = base.meta.pop('shard')
+        # shards are expanded once they've been merged
+        base.meta.pop('dense', None)
+        ranges = utils.date.split(raw['start_date'], raw['end_date'], interval)
+        shards = [base.range(start, stop) for start, stop in ranges]
+
+        # shards share the workers, rather than each fetching
+        # its pages with as many workers as all of them together
+        pool = ThreadPool(min(workers, len(shards)))
+        per_shard = max(1, workers // len(shards))
+        try:
+            reports = pool.map(partial(CoreQuery._get_unsampled, workers=per_shard), shards)
+        finally:
+            pool.terminate()
+
+        return merge(utils.flatten(reports))
+
+    def _get_unsampled(self, workers):
+        report = self.get(workers)
+        raw = self.build()
+        start = raw['start_date']
+        stop = raw['end_date']
+
+        if report.is_sampled and start != stop:
+            halves = [self.range(*half) for half in utils.date.bisect(start, stop)]
+            return utils.flatten([half._get_unsampled(workers) for half in halves])
+        else:
+            return [report]
+
+    def pages(self, total):
+        """
+        Given the total amount of results (`totalResults` in the response
+        to the first page), return queries for each of the remaining pages,
+        stopping early if the query has a limit.
+        """
+
+        start = self.raw.get('start_index', 1)
+        stop = min(total, start + self.meta.get('limit', float('inf')) - 1)
+
+        cursor = self.next()
+        while cursor.raw['start_index'] <= stop:
+            remaining = stop - cursor.raw['start_index'] + 1
+            if 'limit' in self.meta and remaining < cursor.raw.get('max_results', 1000):
+                # don't ask for rows beyond the limit on the last page
+                cursor = cursor.set(max_results=remaining)
+            yield cursor
+            cursor = cursor.next()
+
 
 
 class RealTimeQuery(Query):
@@ -1085,7 +1978,114 @@ class RealTimeQuery(Query):
         return self
 
     def get(self):
-        return self.execute()
+        return self._run().execute()
+
+
+# The API accepts up to 1000 calls in a single batch, but runs them
+# concurrently, and a profile allows for at most 10 concurrent requests.
+BATCH_LIMIT = 10
+
+
+def batch(queries, size=BATCH_LIMIT, workers=4):
+    """
+    Run many queries in as few HTTP round trips as possible,
+    packing up to `size` queries into a single batch request.
+
+    Returns a list with a `Report` for every query, in the same
+    order as the queries, or the exception that was raised for
+    queries that failed, so one bad query doesn't spoil the batch.
+
+    ```python
+    reports = ga.query.batch([
+        profile.core.query.metrics('pageviews').range('yesterday'),
+        profile.core.query.metrics('sessions').range('yesterday'),
+    ])
+    ```
+
+    Only the first page of each query is part of the batch, any
+    remaining pages are fetched afterwards. Sharded queries
+    are not batched but run one after the other. Queries that
+    fail because of rate limits or server errors are retried
+    in another batch, see `Query#retry`.
+    """
+
+    # the queries in a batch share a single retry budget,
+    # unless they come with their own
+    budget = utils.retry.Budget(utils.retry.DEFAULTS['budget'])
+    queries = [query if 'budget' in query.meta else query.retry(budget=budget) for query in queries]
+    results = [None] * len(queries)
+    pending = []
+
+    def attempt(fn, *vargs):
+        try:
+            return fn(*vargs)
+        except Exception as err:
+            return err
+
+    def receive(i, query, request_id, response, exception):
+        # exceptions that escape this callback would abort the whole
+        # batch, so a response that can't be handled only fails its query
+        if exception is None:
+            query.limiter.speed_up()
+            try:
+                query._store(response)
+                results[i] = Report(response, query)
+            except Exception as err:
+                results[i] = err
+        else:
+            results[i] = query._failed(exception)
+
+    for i, query in enumerate(queries):
+        if 'shard' in query.meta:
+            results[i] = attempt(query.get, workers)
+            continue
+
+        response = query._lookup()
+        if response is not None:
+            results[i] = Report(response, query)
+            continue
+
+        request = attempt(query._request)
+        if isinstance(request, Exception):
+            results[i] = request
+        else:
+            pending.append((i, query, request, 0))
+
+    # queries that fail because of rate limits or server
+    # errors are tried again in another batch
+    while pending:
+        services = collections.OrderedDict()
+        for item in pending:
+            services.setdefault(id(item[1].account.service), []).append(item)
+
+        for requests in services.values():
+            for offset in range(0, len(requests), size):
+                chunk = requests[offset:offset + size]
+                account = chunk[0][1].account
+                http = account.service.new_batch_http_request()
+                for i, query, request, retries in chunk:
+                    query.limiter.acquire()
+                    http.add(request, callback=partial(receive, i, query), request_id=str(i))
+
+                try:
+                    http.execute(http=account.http)
+                except Exception as err:
+                    for i, query, request, retries in chunk:
+                        if results[i] is None:
+                            results[i] = query._failed(err)
+
+        failed = [item for item in pending if item[1]._retry(results[item[0]], item[3])]
+        if failed:
+            time.sleep(utils.retry.backoff(max(item[3] for item in failed)))
+        pending = [(i, query, request, retries + 1) for i, query, request, retries in failed]
+        for item in pending:
+            results[item[0]] = None
+
+    for i, query in enumerate(queries):
+        if isinstance(results[i], Report) and 'shard' not in query.meta:
+            results[i] = attempt(query._complete, results[i], workers)
+
+    return results
 
 
 # TODO: consider moving the blueprint functionality to a separate Python package
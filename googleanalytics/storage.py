@@ -0,0 +1,391 @@
+# encoding: utf-8
+
+"""
+Columnar storage for reports. Every column is kept in a single
+typed `array.array` when its values are integers or floats, and
+in a list for anything else, like strings and dates.
+
+With NumPy installed, `view` gives access to a numeric column
+as a NumPy array without copying it.
+
+Reports can be saved to disk in a binary columnar format, with
+a JSON header that describes the columns, followed by a fixed-width
+array for every numeric column and a dictionary-encoded array of
+codes for any other column. `load` memory-maps these files: numeric
+columns are views into the file and only the parts of the file that
+are accessed are ever read.
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+from datetime import datetime
+
+from . import utils
+from .columns import Column
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+
+# 64-bit integers (`q`) are not available on Python 2
+try:
+    array.array('q')
+    INTEGER = 'q'
+except ValueError:
+    INTEGER = 'l'
+
+TYPECODES = {
+    int: INTEGER,
+    float: 'd',
+}
+
+
+def typecode(store):
+    """ The typecode of a store with fixed-width values, or `None`. """
+    if isinstance(store, array.array):
+        return store.typecode
+    elif isinstance(store, memoryview):
+        return store.format
+    else:
+        return None
+
+
+def cast(column, values):
+    """
+    Cast the raw values for a column all at once: numbers
+    straight into an array, strings into a list and anything
+    else, like dates, parsing every distinct value only once.
+    """
+
+    caster = column.cast
+    typecode = TYPECODES.get(caster)
+    if typecode:
+        return array.array(typecode, map(caster, values))
+    elif caster is utils.unicode:
+        return list(map(caster, values))
+    else:
+        memo = {value: caster(value) for value in set(values)}
+        return list(map(memo.__getitem__, values))
+
+
+def empty(column):
+    """ An empty store for the values of a column. """
+    typecode = TYPECODES.get(column.cast)
+    if typecode:
+        return array.array(typecode)
+    else:
+        return []
+
+
+def extend(store, values):
+    """
+    Add values to a store and return the store, which is a new
+    list if the values do not fit into the array, e.g. for metrics
+    that could not be aggregated and are `None`.
+    """
+
+    if isinstance(store, memoryview):
+        store = array.array(store.format, store)
+    elif isinstance(store, Dictionary):
+        store = list(store)
+
+    if isinstance(store, array.array):
+        try:
+            if isinstance(values, array.array) and values.typecode == store.typecode:
+                typed = values
+            else:
+                typed = array.array(store.typecode, values)
+        except (TypeError, OverflowError):
+            store = list(store)
+        else:
+            try:
+                store.extend(typed)
+            except BufferError:
+                # a NumPy view of the array keeps it from growing in place
+                store = store + typed
+            return store
+
+    store.extend(values)
+    return store
+
+
+def build(column, values):
+    return extend(empty(column), values)
+
+
+def view(store):
+    """
+    A read-only NumPy array for a store, which shares memory with
+    numeric columns. Without NumPy, the store itself.
+    """
+
+    code = typecode(store)
+    if numpy is None:
+        return store
+    elif code:
+        vector = numpy.frombuffer(store, dtype=code) if len(store) else numpy.array([], dtype=code)
+    else:
+        vector = numpy.array(store, dtype=object)
+    vector.flags.writeable = False
+    return vector
+
+
+class Rows(Sequence):
+    """
+    A row-wise view of a report's columns. Rows are
+    only turned into named tuples as you access them.
+    """
+
+    def __init__(self, report):
+        self.report = report
+
+    def __len__(self):
+        data = self.report.data
+        if data:
+            return len(data[0])
+        else:
+            return 0
+
+    def __getitem__(self, key):
+        Row = self.report.Row
+        data = self.report.data
+        if isinstance(key, slice):
+            return [Row._make(row) for row in zip(*[store[key] for store in data])]
+        else:
+            return Row._make([store[key] for store in data])
+
+    def __iter__(self):
+        Row = self.report.Row
+        for row in zip(*self.report.data):
+            yield Row._make(row)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (Rows, list, tuple)):
+            return list(self) == list(other)
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        else:
+            return not equal
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Index(Mapping):
+    """
+    A hash index of the rows in a report by the values of one or
+    more of its columns. Keys are tuples of values, or just the value
+    when indexing on a single column, and every key maps to a list of
+    the rows with those values.
+    """
+
+    def __init__(self, report, stores):
+        self.report = report
+        self.positions = positions = {}
+        if len(stores) == 1:
+            keys = stores[0]
+        else:
+            keys = zip(*stores)
+        for i, key in enumerate(keys):
+            rows = positions.get(key)
+            if rows is None:
+                positions[key] = [i]
+            else:
+                rows.append(i)
+
+    def __getitem__(self, key):
+        rows = self.report.rows
+        return [rows[i] for i in self.positions[key]]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+
+class Dictionary(Sequence):
+    """
+    A dictionary-encoded column: the distinct values
+    and, for every row, the position of its value.
+    """
+
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.values[code] for code in self.codes[key]]
+        else:
+            return self.values[self.codes[key]]
+
+    def __iter__(self):
+        values = self.values
+        for code in self.codes:
+            yield values[code]
+
+
+# files start with `MAGIC` and the length of the header,
+# and every column starts at a multiple of `ALIGNMENT` bytes
+MAGIC = b'GAREPORT'
+VERSION = 1
+ALIGNMENT = 8
+CODES = 'I'
+
+# dates and times are saved in the same format as in API responses,
+# so they can be cast back with the column they belong to
+FORMATS = {
+    'ga:date': '%Y%m%d',
+    'ga:dateHour': '%Y%m%d%H',
+}
+
+
+def pad(size):
+    return -size % ALIGNMENT
+
+
+def tobytes(store):
+    try:
+        return store.tobytes()
+    except AttributeError:
+        return store.tostring()
+
+
+def encode(values):
+    index = {}
+    unique = []
+    codes = array.array(CODES)
+    for value in values:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(unique)
+            unique.append(value)
+        codes.append(code)
+    return codes, unique
+
+
+def save(report, path):
+    """
+    Save a report in a binary columnar format,
+    see `load` to open it again.
+    """
+
+    columns = []
+    stores = []
+    buffers = []
+    offset = 0
+    for column, store in zip(report.columns, report.data):
+        code = typecode(store)
+        if code:
+            buffer = tobytes(store)
+            description = {'encoding': 'plain', 'typecode': code}
+        else:
+            codes, values = encode(store)
+            if column.id in FORMATS:
+                values = [value.strftime(FORMATS[column.id]) for value in values]
+            buffer = tobytes(codes)
+            description = {'encoding': 'dictionary', 'typecode': CODES, 'values': values}
+        description['offset'] = offset
+        description['size'] = len(buffer)
+        columns.append({'id': column.id, 'attributes': column.attributes})
+        stores.append(description)
+        buffers.append(buffer)
+        offset = offset + len(buffer) + pad(len(buffer))
+
+    header = json.dumps({
+        'version': VERSION,
+        'byteorder': sys.byteorder,
+        'columns': columns,
+        'stores': stores,
+        'since': report.since and report.since.strftime('%Y-%m-%d'),
+        'until': report.until and report.until.strftime('%Y-%m-%d'),
+        'totals': report.totals,
+        'total': report.total,
+        }).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * pad(len(header)))
+        for buffer in buffers:
+            f.write(buffer)
+            f.write(b'\0' * pad(len(buffer)))
+
+
+def mapped(memory, code, start, size):
+    try:
+        return memoryview(memory)[start:start + size].cast(code)
+    except (AttributeError, TypeError):
+        # Python 2 can only copy out of a memory map
+        store = array.array(code)
+        store.fromstring(memory[start:start + size])
+        return store
+
+
+def load(path):
+    """
+    Memory-map a report saved with `save`. Returns the metadata in the
+    header, the columns and a store for every column, which reads from
+    the file on access.
+    """
+
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a saved report: " + path)
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+        if header['version'] != VERSION or header['byteorder'] != sys.byteorder:
+            raise ValueError("Cannot open report saved with an incompatible version or byte order: " + path)
+        memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    start = len(MAGIC) + 8 + length + pad(length)
+    columns = []
+    data = []
+    for metadata, description in zip(header['columns'], header['stores']):
+        column = Column.from_metadata(metadata)
+        code = description['typecode']
+        if code == 'q':
+            code = INTEGER
+        store = mapped(memory, code, start + description['offset'], description['size'])
+        if description['encoding'] == 'dictionary':
+            values = description['values']
+            if column.id in FORMATS:
+                values = [column.cast(value) for value in values]
+            store = Dictionary(store, values)
+        columns.append(column)
+        data.append(store)
+
+    for key in ('since', 'until'):
+        if header[key]:
+            header[key] = datetime.strptime(header[key], '%Y-%m-%d')
+
+    return header, columns, data
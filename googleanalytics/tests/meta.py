@@ -1,5 +1,11 @@
 # encoding: utf-8
 
+import gc
+import json
+import os
+import tempfile
+import weakref
+
 import googleanalytics as ga
 
 from . import base
@@ -25,6 +31,58 @@ class TestMetaData(base.TestCase):
         self.assertEqual(a, b)
         self.assertEqual(b, c)
 
+    def test_shared_columns(self):
+        """ Profiles should share their columns, which cannot be changed. """
+        other = ga.account.Profile(self.profile.raw, self.webproperty)
+        self.assertIs(other.core.all_columns, self.profile.core.all_columns)
+        with self.assertRaises(AttributeError):
+            other.core.columns['pageviews'].name = 'Views'
+
+    def test_template_columns(self):
+        """ It should find columns that belong to a template column by id or name. """
+        columns = self.profile.core.all_columns
+        goal = columns['ga:goal12Completions']
+
+        self.assertEqual(goal.name, 'Goal 12 Completions')
+        self.assertIs(columns['Goal 12 Completions'], goal)
+        self.assertEqual(len(columns['ga:goalXXCompletions'].expand()), 20)
+
+    def test_snapshot(self):
+        """ It should come with the columns of the real time reporting API,
+        and take a snapshot of the core reporting API's columns as they
+        are returned by the metadata API. """
+        snapshot = ga.metadata.bundled()
+        self.assertIn('columns:rt', snapshot)
+        column = self.profile.realtime.all_columns['activeUsers']
+        self.assertEqual(column.id, 'rt:activeUsers')
+
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot.json')
+        ga.metadata.snapshot(self.account.service, path)
+        with open(path) as f:
+            snapshot = json.load(f)
+        self.assertTrue(snapshot['columns:ga']['etag'])
+        self.assertGreater(snapshot['columns:ga']['checked'], 0)
+        core = ga.metadata.hydrate(snapshot['columns:ga']['items'], unique=False)
+        self.assertEqual(core.columns['pageviews'].id, 'ga:pageviews')
+
+    def test_invalidate(self):
+        """ It should cache web properties on their account, until they are
+        invalidated or the account is no longer used. """
+        memoized = ga.account.Account.webproperties.fget
+        webproperties = self.account.webproperties
+        hits = memoized.stats.hits
+        self.assertIs(self.account.webproperties, webproperties)
+        self.assertEqual(memoized.stats.hits, hits + 1)
+
+        ga.utils.invalidate(self.account, 'webproperties')
+        self.assertIsNot(self.account.webproperties, webproperties)
+
+        account = ga.account.Account(self.account.raw, self.account.service, self.account.credentials)
+        account.webproperties[0].profiles
+        account = weakref.ref(account)
+        gc.collect()
+        self.assertIsNone(account())
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -3,6 +3,9 @@
 import googleanalytics as ga
 import os
 import datetime
+import json
+import tempfile
+import unittest
 
 from . import base
 
@@ -64,6 +67,60 @@ class TestQuerying(base.TestCase):
         self.assertNotEqual(a, b)
         self.assertNotEqual(a.raw, b.raw)
 
+    def test_rate_limiter_shared(self):
+        """ Queries derived from one another should share a single rate limiter. """
+        a = self.query.metrics('pageviews')
+        b = a.range('2014-07-01')
+
+        self.assertIs(a.limiter, b.limiter)
+        self.assertIs(a.limiter, self.profile.realtime.query.limiter)
+
+    def test_cache(self):
+        """ It can cache responses and serve queries from the cache. """
+        path = os.path.join(tempfile.mkdtemp(), 'responses.db')
+        self.profile.core.cache = cache = ga.cache.SQLiteCache(path)
+        q = self.query.metrics('pageviews').range('2014-07-01', '2014-07-05')
+        signature = q.signature
+        a = q.get()
+        b = q.get()
+
+        self.assertEqual(q.raw['metrics'], ['ga:pageviews'])
+        self.assertEqual(cache.get(signature), a.raw[0])
+        self.assertEqual(a.rows, b.rows)
+
+    def test_cache_today(self):
+        """ It doesn't cache date ranges that end today, as that data keeps changing. """
+        from unittest import mock
+
+        path = os.path.join(tempfile.mkdtemp(), 'responses.db')
+        self.profile.core.cache = ga.cache.SQLiteCache(path)
+        today = ga.utils.date.today(self.profile.timezone)
+        q = self.query.metrics('pageviews').range(today - datetime.timedelta(days=7), today)
+        request = ga.query.CoreQuery._request
+
+        with mock.patch.object(ga.query.CoreQuery, '_request', autospec=True, side_effect=request) as fetched:
+            q.get()
+            q.get()
+
+        self.assertFalse(q.cacheable)
+        self.assertEqual(fetched.call_count, 2)
+
+    def test_cache_relative(self):
+        """ It keeps relative dates until the query runs, resolves them
+        in the timezone of the profile and caches those queries until midnight. """
+        q = self.query.metrics('pageviews').range('yesterday')
+        weekly = self.query.metrics('pageviews').daily('7daysAgo', days=7)
+        raw = q.build()
+        report = q.get()
+        yesterday = ga.utils.date.today(self.profile.timezone) - datetime.timedelta(days=1)
+
+        self.assertEqual(q.raw['start_date'], 'yesterday')
+        self.assertEqual(weekly.raw['end_date'], 'yesterday')
+        self.assertTrue(q.is_relative)
+        self.assertEqual(raw['start_date'], yesterday.isoformat())
+        self.assertEqual(raw['end_date'], yesterday.isoformat())
+        self.assertEqual(self.profile.core.relative_cache.get(q.signature), report.raw[0])
+
     def test_granularity(self):
         """ It should have shortcut functions that make it easier to
         define the granularity (hour, day, week, month, year) at which
@@ -87,6 +144,98 @@ class TestQuerying(base.TestCase):
 
         self.assertEqual(len(report.queries), 3)
 
+    def test_step_concurrent(self):
+        """ It fetches pages concurrently without changing the order of rows. """
+        q = self.query.metrics('pageviews') \
+            .range('2014-07-01', '2014-07-10').interval('day') \
+            .step(2)
+        sequential = q.get(workers=1)
+        concurrent = q.get(workers=4)
+
+        self.assertEqual(len(concurrent.queries), 5)
+        self.assertEqual(sequential.rows, concurrent.rows)
+
+    def test_iter_rows(self):
+        """ It can stream rows page by page, honoring step and limit. """
+        base = self.query.metrics('pageviews') \
+            .range('2014-07-01', '2014-07-10').interval('day')
+        report = base.get()
+
+        self.assertEqual(list(base.step(2).iter_rows()), report.rows)
+        self.assertEqual(list(base.limit(5).step(2).iter_rows()), report.rows[:5])
+        self.assertEqual(list(report), report.rows)
+
+    def test_refresh(self):
+        """ It can bring a report up to date by fetching only the most recent days. """
+        previous = self.query.metrics('pageviews').daily('2014-07-01', '2014-07-10').get()
+        q = self.query.metrics('pageviews').daily('2014-07-01', '2014-07-20')
+        refreshed = q.refresh(previous, window=2)
+
+        self.assertEqual(refreshed.rows, q.get().rows)
+        self.assertEqual(refreshed.queries[-1].raw['start_date'], '2014-07-09')
+
+    def test_batch(self):
+        """ It can run many queries in a single batch and report errors per query. """
+        base = self.query.metrics('pageviews').range('2014-07-01', '2014-07-05')
+        daily = base.interval('day')
+        invalid = base.set(metrics=[])
+        reports = ga.query.batch([base, daily, invalid])
+
+        self.assertEqual(reports[0].rows, base.get().rows)
+        self.assertEqual(reports[1].rows, daily.get().rows)
+        self.assertIsInstance(reports[2], Exception)
+
+    @unittest.skipUnless(hasattr(ga.query.Query, 'aget'), "requires Python 3.6 or later")
+    def test_aget(self):
+        """ It can run queries asynchronously, with every page after the first in flight at once. """
+        import asyncio
+
+        q = self.query.metrics('pageviews') \
+            .range('2014-07-01', '2014-07-10').interval('day') \
+            .step(2)
+        report = q.get()
+        responses = dict(zip([page.raw.get('start_index', 1) for page in report.queries], report.raw))
+        self.profile.core.transport = transport = ga.aio.StubTransport(
+            lambda page: responses[page.raw.get('start_index', 1)], delay=0.01)
+        loop = asyncio.new_event_loop()
+        try:
+            async_report = loop.run_until_complete(q.aget())
+        finally:
+            loop.close()
+
+        self.assertEqual(report.rows, async_report.rows)
+        self.assertEqual(len(transport.queries), len(report.queries))
+        self.assertGreater(transport.peak, 1)
+
+    def test_retry(self):
+        """ It classifies API errors and only retries transient ones, within a shared budget. """
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        def error(status, reason):
+            content = {'error': {'errors': [{'reason': reason}], 'code': status, 'message': reason}}
+            return HttpError(httplib2.Response({'status': status}), ga.utils.unicode(json.dumps(content)).encode('utf-8'))
+
+        limited = ga.errors.classify(error(403, 'userRateLimitExceeded'))
+        forbidden = ga.errors.classify(error(403, 'insufficientPermissions'))
+        q = self.query.metrics('pageviews').retry(3, budget=1)
+
+        self.assertIsInstance(limited, ga.errors.LimitExceededError)
+        self.assertIsInstance(forbidden, ga.errors.NotPermittedError)
+        self.assertFalse(q._retry(forbidden, 0))
+        self.assertTrue(q._retry(limited, 0))
+        self.assertFalse(q.step(2)._retry(limited, 0))
+
+    def test_shard(self):
+        """ It can split a query into shorter date ranges and merge the results. """
+        base = self.query.metrics('pageviews', 'users').dimensions('pagepath').range('2014-07-01', '2014-07-31')
+        unsharded = base.get()
+        sharded = base.shard('week').get()
+
+        self.assertEqual(unsharded.totals['ga:pageviews'], sharded.totals['ga:pageviews'])
+        self.assertEqual(set(unsharded['pagepath']), set(sharded['pagepath']))
+        self.assertIn('ga:users', sharded.flagged)
+
     def test_limit(self):
         """ It can limit the total amount of results. """
         base = self \
@@ -169,6 +318,68 @@ class TestQuerying(base.TestCase):
         q = self.query.metrics('pageviews').filter(medium=['cpc', 'cpm']).filter(usertype__neq='Returning User').build()
         self.assertEqual(q['filters'], 'ga:medium==cpc,ga:medium==cpm;ga:userType!=Returning User')
 
+    def test_qualified(self):
+        """ It should add metrics and dimensions with full ids without waiting for metadata,
+        and be able to cast values using only the column headers of a response. """
+        q = self.query.metrics('ga:pageviews').dimensions('ga:date')
+        self.assertEqual(q.raw['metrics'], ['ga:pageviews'])
+
+        raw = q.range('2014-07-01', days=2).execute().raw[0]
+        columns = ga.query.header_columns(raw['columnHeaders'])
+        self.assertIs(columns['ga:pageviews'].cast, int)
+        self.assertIs(columns['ga:date'].cast, ga.columns.DIMENSIONS['ga:date'])
+
+        # ids the metadata doesn't know about are cast using the column headers
+        from unittest import mock
+
+        with mock.patch.object(ga.metadata.catalog, 'columns', wraps=ga.metadata.catalog.columns) as columns:
+            q = self.query.metrics('ga:pageviews').dimensions('ga:dimension201')
+            report = ga.query.Report({
+                'columnHeaders': [
+                    {'name': 'ga:dimension201', 'columnType': 'DIMENSION', 'dataType': 'STRING'},
+                    {'name': 'ga:pageviews', 'columnType': 'METRIC', 'dataType': 'INTEGER'},
+                    ],
+                'rows': [['a', '3']],
+                'totalsForAllResults': {'ga:pageviews': '3'},
+                'query': {},
+                }, q)
+
+        self.assertEqual(q.raw['dimensions'], ['ga:dimension201'])
+        self.assertEqual(report['ga:pageviews'], [3])
+        self.assertFalse(any(call[1].get('fresh') for call in columns.call_args_list))
+
+    def test_qualified_lookup(self):
+        """ It should never look up full ids in the metadata, whether or not there is any. """
+        from unittest import mock
+
+        for api, ids in [(self.profile.core, ['ga:pageviews', 'ga:date']), (self.profile.realtime, ['rt:activeUsers', 'rt:pagePath'])]:
+            for cached in (False, True):
+                if cached:
+                    api.columns
+                else:
+                    ga.metadata.catalog.path = None
+                    ga.metadata.catalog.invalidate()
+                with mock.patch.object(api, 'lookup') as lookup, \
+                        mock.patch.object(ga.metadata.catalog, 'columns') as columns:
+                    q = api.query.metrics(ids[0]).dimensions(ids[1])
+                self.assertEqual((q.raw['metrics'], q.raw['dimensions']), ([ids[0]], [ids[1]]))
+                self.assertFalse(lookup.called)
+                self.assertFalse(columns.called)
+
+    def test_qualified_names(self):
+        """ It should serialize columns under the same names whether or not
+        there was metadata when the query ran. """
+        ga.metadata.catalog.path = os.path.join(tempfile.mkdtemp(), 'metadata.json')
+        ga.metadata.catalog.invalidate()
+        q = self.query.metrics('ga:pageviews').dimensions('ga:date').range('2014-07-01', days=2)
+        cold = q.get()
+        self.assertIsNone(cold.source)
+        cold = cold.serialize('csv').splitlines()[0]
+
+        warm = q.get()
+        self.assertIsNotNone(warm.source)
+        self.assertEqual(cold, warm.serialize('csv').splitlines()[0])
+        self.assertEqual(cold, 'Date,Pageviews')
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 import googleanalytics as ga
 import datetime
+import json
 
 from . import base
 
@@ -49,3 +50,128 @@ class TestReporting(base.TestCase):
 
         for date in report['date']:
             self.assertIsInstance(date, datetime.date)
+
+    def test_cast_date_hours(self):
+        """ It should cast columns containing hours to datetime objects. """
+        q = self.query.metrics('pageviews').hourly('2014-07-01', '2014-07-02')
+        report = q.get()
+
+        for date_hour in report['date_hour']:
+            self.assertIsInstance(date_hour, datetime.datetime)
+
+    def test_shared_schema(self):
+        """ Reports with the same columns should share their column lists and row classes. """
+        q = self.query.metrics('pageviews').dimensions('pagepath').range('yesterday')
+        a = q.get()
+        b = q.get()
+        self.assertIs(a.Row, b.Row)
+        self.assertIs(a.columns, b.columns)
+        self.assertFalse(hasattr(a.first, '__dict__'))
+
+    def test_lookup(self):
+        """ It should look up rows by their dimension values through a cached index. """
+        report = self.query.metrics('pageviews').dimensions('pagepath').daily('2014-07-01', '2014-07-02').get()
+        row = report.last
+
+        self.assertEqual(report.lookup(date=row.date, pagepath=row.page_path), row)
+        self.assertIsNone(report.lookup(date=row.date, pagepath='/does-not-exist'))
+        self.assertIs(report.index('pagepath'), report.index('pagepath'))
+        self.assertEqual(report.index('pagepath')[row.page_path],
+            [other for other in report.rows if other.page_path == row.page_path])
+
+    def test_columnar(self):
+        """ It should store numeric columns in typed arrays and build rows from them on demand. """
+        report = self.query.metrics('pageviews').dimensions('pagepath').daily(days=-10).get()
+        pageviews = report.array('pageviews')
+
+        self.assertEqual(list(pageviews), report['pageviews'])
+        self.assertEqual(len(report.rows), len(pageviews))
+        self.assertEqual(report.rows[-1].pageviews, pageviews[-1])
+
+    def test_dataframe(self):
+        """ It should convert reports into data frames with the proper types. """
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest("requires pandas")
+
+        report = self.query.metrics('pageviews').dimensions('pagepath').daily('2014-07-01', '2014-07-02').get()
+        df = report.as_dataframe(categorical=['pagepath'])
+
+        self.assertEqual(str(df['pageviews'].dtype), 'int64')
+        self.assertEqual(str(df['date'].dtype), 'datetime64[ns]')
+        self.assertEqual(str(df['page_path'].dtype), 'category')
+        self.assertEqual(list(df['pageviews']), report['pageviews'])
+
+    def test_serialize_parquet(self):
+        """ It should serialize reports to Parquet, with types that match the columns. """
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("requires pyarrow")
+
+        import io
+        report = self.query.metrics('pageviews').daily('2014-07-01', '2014-07-02').get()
+        table = pyarrow.parquet.read_table(io.BytesIO(report.serialize('parquet')))
+
+        self.assertEqual(table.column_names, ['date', 'pageviews'])
+        self.assertEqual(str(table.schema.field('pageviews').type), 'int64')
+        self.assertEqual(table.column('date').to_pylist(), report['date'])
+
+    def test_write_ndjson(self):
+        """ It should write reports as newline-delimited JSON, with a line per row. """
+        import io
+        q = self.query.metrics('pageviews').dimensions('pagepath').daily('2014-07-01', '2014-07-02')
+        buf = io.StringIO()
+        q.write(buf, 'ndjson')
+        lines = [json.loads(line) for line in buf.getvalue().splitlines()]
+        report = q.get()
+
+        self.assertEqual(len(lines), len(report))
+        self.assertEqual(lines[0], report.serialize()[0])
+
+    def test_save(self):
+        """ It should save reports to disk and memory-map them when opening them again. """
+        import os
+        import tempfile
+        report = self.query.metrics('pageviews').dimensions('pagepath').daily('2014-07-01', '2014-07-02').get()
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            report.save(path)
+            opened = ga.query.Report.open(path)
+            self.assertEqual(opened.rows, report.rows)
+            self.assertEqual(opened.granularity.id, 'ga:date')
+            self.assertEqual((opened.since, opened.until), (report.since, report.until))
+            self.assertEqual(opened.totals, report.totals)
+            # and they can be rolled up into time dimensions they don't have
+            self.assertEqual(opened.rollup('total', by=[]).first.pageviews, sum(report['pageviews']))
+            self.assertEqual(opened.rollup('month').serialize(), report.rollup('month').serialize())
+        finally:
+            os.remove(path)
+
+    def test_expand(self):
+        """ It should fill in rows for days without any data. """
+        q = self.query.metrics('pageviews').dimensions('pagepath').daily('2014-07-01', '2014-07-10')
+        report = q.get()
+        expanded = report.expand()
+        pages = set(report['pagepath'])
+
+        self.assertEqual(len(expanded), 10 * len(pages))
+        self.assertTrue(set(report.rows).issubset(set(expanded.rows)))
+        self.assertEqual(q.dense().get().rows, expanded.rows)
+        self.assertEqual(list(q.dense().step(5).iter_rows()), expanded.rows)
+
+    def test_rollup(self):
+        """ It should roll up reports into a coarser granularity locally,
+        recomputing ratios and refusing metrics that cannot be added up. """
+        q = self.query.metrics('pageviews', 'bounces', 'sessions', 'bounceRate').dimensions('pagepath')
+        report = q.daily('2014-07-01', '2014-07-31').get()
+        monthly = report.rollup('month', by=[])
+
+        self.assertEqual(monthly.granularity.id, 'ga:yearMonth')
+        self.assertEqual(monthly.first.pageviews, sum(report['pageviews']))
+        self.assertAlmostEqual(monthly.first.bounce_rate, 100.0 * monthly.first.bounces / monthly.first.sessions)
+        self.assertRaises(ValueError, report.rollup, 'hour')
+        users = self.query.metrics('users').daily('2014-07-01', '2014-07-31').get()
+        self.assertRaises(ValueError, users.rollup, 'month')
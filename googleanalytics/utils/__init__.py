@@ -2,11 +2,10 @@
 
 import os
 import copy
-import operator
-import functools
+import itertools
 
-from . import date
-from .functional import memoize, immutable, identity, soak, vectorize
+from . import date, ratelimit, retry
+from .functional import memoize, invalidate, immutable, identity, soak, vectorize
 from .server import single_serve
 from .string import format, affix, paste, cut
 
@@ -37,7 +36,7 @@ def here(*segments):
 
 # flatten nested lists
 def flatten(l):
-    return functools.reduce(operator.add, l)
+    return list(itertools.chain.from_iterable(l))
 
 
 # wrap scalars into a list
@@ -1,8 +1,9 @@
 import datetime
 import re
 
+from dateutil import tz
 from dateutil.parser import parse
-from dateutil.relativedelta import relativedelta
+from dateutil.relativedelta import relativedelta, SU
 
 
 # Python 2 and 3 compatibility
@@ -29,8 +30,31 @@ def extract(obj):
         raise ValueError("Can only extract date for type: date, datetime. Received: {}".format(obj))
 
 
-def parse_description(s):
-    today = datetime.date.today()
+def today(timezone=None):
+    """ Today's date in a timezone like `Europe/Brussels`, local time by default. """
+    return datetime.datetime.now(tz.gettz(timezone)).date()
+
+
+def until_midnight(timezone=None):
+    """ The amount of seconds until the next day starts in a timezone. """
+    zone = tz.gettz(timezone)
+    now = datetime.datetime.now(zone)
+    midnight = datetime.datetime.combine(now.date() + relativedelta(days=1), datetime.time(tzinfo=zone))
+    # subtracting datetimes that share a timezone ignores
+    # daylight saving time transitions, UTC doesn't have any
+    return (midnight.astimezone(tz.tzutc()) - now.astimezone(tz.tzutc())).total_seconds()
+
+
+DESCRIPTION = re.compile(r'^(today|yesterday|\d+daysAgo)$')
+
+
+def is_description(obj):
+    """ Whether an object describes a date relative to today, like `yesterday` or `7daysAgo`. """
+    return isinstance(obj, basestring) and bool(DESCRIPTION.match(obj))
+
+
+def parse_description(s, today=None):
+    today = today or datetime.date.today()
     if s == 'today':
         return today
     elif s == 'yesterday':
@@ -43,7 +67,26 @@ def parse_description(s):
             raise ValueError("Can only parse descriptions of the format: today, yesterday, ndaysAgo")
 
 
-def normalize(obj):
+def describe(date, today=None):
+    """
+    Describe a date relative to today, the way Google Analytics
+    would: `today`, `yesterday` or `ndaysAgo`. Dates after today
+    cannot be described this way and are serialized instead.
+    """
+
+    today = today or datetime.date.today()
+    days = (today - date).days
+    if days < 0:
+        return serialize(date)
+    elif days == 0:
+        return 'today'
+    elif days == 1:
+        return 'yesterday'
+    else:
+        return '{}daysAgo'.format(days)
+
+
+def normalize(obj, today=None):
     if obj == None:
         return None
     elif isinstance(obj, datetime.date):
@@ -53,17 +96,27 @@ def normalize(obj):
             return extract(parse(obj))
         except ValueError:
             try:
-                return extract(parse_description(obj))
+                return extract(parse_description(obj, today))
             except ValueError:
                 raise ValueError("Cannot parse date or description: " + obj)
     else:
         raise ValueError("Can only normalize dates of type: date, datetime, basestring.")
 
 
-def range(start=None, stop=None, months=0, days=0):
-    yesterday = datetime.date.today() - relativedelta(days=1)
-    start = normalize(start) or yesterday
-    stop = normalize(stop)
+def range(start=None, stop=None, months=0, days=0, today=None, relative=False):
+    """
+    The start and end date of a date range, as strings. With `relative`,
+    dates that were described relative to today (or derived from one,
+    like the default start date, yesterday) are returned as descriptions
+    like `7daysAgo`, so they can be resolved again on another day.
+    """
+
+    today = today or datetime.date.today()
+    yesterday = today - relativedelta(days=1)
+    start_is_relative = start is None or is_description(start)
+    stop_is_relative = is_description(stop) if stop is not None else start_is_relative
+    start = normalize(start, today) or yesterday
+    stop = normalize(stop, today)
     is_past = days < 0 or months < 0
 
     if days or months:
@@ -81,8 +134,61 @@ def range(start=None, stop=None, months=0, days=0):
             stop = start + delta
 
     stop = stop or start
-    return map(serialize, sorted((start, stop)))
+    dates = sorted([(start, start_is_relative), (stop, stop_is_relative)])
+    return [describe(date, today) if relative and described else serialize(date)
+        for date, described in dates]
 
 
 def is_relative(datestring):
     return not '-' in datestring
+
+
+# the first day of the next day, week, month or year;
+# weeks start on Sunday, as they do in Google Analytics
+BOUNDARIES = {
+    'day': dict(days=1),
+    'week': dict(days=1, weekday=SU),
+    'month': dict(months=1, day=1),
+    'year': dict(years=1, month=1, day=1),
+}
+
+
+# the first day of the day, week, month or year a date is part of
+FLOORS = {
+    'day': dict(),
+    'week': dict(weekday=SU(-1)),
+    'month': dict(day=1),
+    'year': dict(month=1, day=1),
+}
+
+
+def floor(date, interval):
+    """ The first day of the calendar day, week, month or year a date falls in. """
+    return normalize(date) + relativedelta(**FLOORS[interval])
+
+
+def split(start, stop, interval):
+    """
+    Split a date range into consecutive date ranges that
+    follow calendar days, weeks, months or years.
+    """
+
+    start = normalize(start)
+    stop = normalize(stop)
+    ranges = []
+
+    while start <= stop:
+        boundary = start + relativedelta(**BOUNDARIES[interval])
+        end = min(stop, boundary - relativedelta(days=1))
+        ranges.append((start, end))
+        start = end + relativedelta(days=1)
+
+    return ranges
+
+
+def bisect(start, stop):
+    """ Split a date range of at least two days in half. """
+    start = normalize(start)
+    stop = normalize(stop)
+    middle = start + (stop - start) // 2
+    return [(start, middle), (middle + relativedelta(days=1), stop)]
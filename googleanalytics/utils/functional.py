@@ -1,20 +1,132 @@
 # encoding: utf-8
 
+import collections
 import functools
+import threading
+import time
+import weakref
+
 import inspector
 
 
-class memoize:
-  def __init__(self, function):
-    self.function = function
-    self.memoized = {}
+# the clock for cache expiry, which shouldn't jump when the system time is adjusted
+now = getattr(time, 'monotonic', time.time)
+
+Stats = collections.namedtuple('Stats', ['hits', 'misses', 'size'])
+
+
+class memoize(object):
+    """
+    Cache what a function returns for the arguments it is called with.
+
+    When the first argument is an object with attributes, as it is for
+    methods and properties, results are cached on that object, so they
+    go away together with it rather than keeping it alive for as long
+    as the process runs. Results for other arguments are kept here, up
+    to `size` of them, dropping whichever was used least recently.
+
+    Results are fetched again when they are older than `ttl` seconds,
+    when given, or when they have been invalidated, either for a
+    single object or for every object at once:
+
+    ```python
+    class Account(object):
+        @property
+        @utils.memoize(ttl=60 * 60)
+        def webproperties(self):
+            ...
+
+    utils.invalidate(account, 'webproperties')
+    Account.webproperties.fget.invalidate()
+    Account.webproperties.fget.stats
+    ```
+    """
+
+    def __init__(self, function=None, ttl=None, size=128):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # results for arguments other than objects with attributes
+        self.memoized = collections.OrderedDict()
+        # objects that hold results of this function
+        self.instances = weakref.WeakSet()
+        if function:
+            self.wrap(function)
+
+    def wrap(self, function):
+        self.function = function
+        functools.update_wrapper(self, function)
+        return self
+
+    def store(self, args):
+        if args and isinstance(getattr(args[0], '__dict__', None), dict):
+            instance = args[0]
+            caches = instance.__dict__.setdefault('__memoized__', {})
+            if self not in caches:
+                caches[self] = collections.OrderedDict()
+                self.instances.add(instance)
+            return caches[self], args[1:]
+        else:
+            return self.memoized, args
+
+    def __call__(self, *args):
+        if not hasattr(self, 'function'):
+            # used as `@memoize(ttl=...)`
+            return self.wrap(*args)
+
+        with self.lock:
+            store, key = self.store(args)
+            if key in store:
+                value, expires = store[key]
+                if expires is None or now() < expires:
+                    self.hits += 1
+                    return value
+
+        value = self.function(*args)
+        expires = now() + self.ttl if self.ttl is not None else None
+
+        with self.lock:
+            self.misses += 1
+            store.pop(key, None)
+            store[key] = (value, expires)
+            if self.size is not None and len(store) > self.size:
+                store.popitem(last=False)
+        return value
+
+    def invalidate(self, instance=None):
+        """ Forget results for `instance`, or all of them. """
+        with self.lock:
+            if instance is None:
+                self.memoized.clear()
+                instances = list(self.instances)
+            else:
+                instances = [instance]
+            for instance in instances:
+                instance.__dict__.get('__memoized__', {}).pop(self, None)
+                self.instances.discard(instance)
+
+    @property
+    def stats(self):
+        """ Cache hits, misses and the amount of results that are currently cached. """
+        with self.lock:
+            size = len(self.memoized) + sum(len(instance.__dict__.get('__memoized__', {}).get(self, ()))
+                for instance in list(self.instances))
+            return Stats(self.hits, self.misses, size)
+
+
+def invalidate(instance, *names):
+    """
+    Forget the memoized properties and methods of an object,
+    or only those with the given names, so they are fetched
+    again the next time they are needed.
+    """
 
-  def __call__(self, *args):
-    try:
-        return self.memoized[args]
-    except KeyError:
-        self.memoized[args] = self.function(*args)
-        return self.memoized[args]
+    caches = instance.__dict__.get('__memoized__', {})
+    for cache in list(caches):
+        if not names or cache.__name__ in names:
+            cache.invalidate(instance)
 
 
 def vectorize(fn):
@@ -0,0 +1,115 @@
+# encoding: utf-8
+
+"""
+Process-wide rate limiting. Queries against the same profile with
+the same credentials share a token bucket, no matter which `Query`
+object or which thread they are executed from.
+
+```python
+# change the defaults for every profile
+ga.utils.ratelimit.configure(qps=5, burst=5)
+# or just for a single credential identity and profile id
+ga.utils.ratelimit.configure('debrouwere', '12345678', qps=2)
+```
+"""
+
+import threading
+import time
+
+
+# `time.monotonic` is not available on Python 2
+clock = getattr(time, 'monotonic', time.time)
+
+
+class TokenBucket(object):
+    """
+    Tokens trickle into the bucket at `qps` tokens per second, up to
+    at most `burst` tokens. Every request takes out a token and has
+    to wait for one to become available when the bucket is empty.
+
+    When the API tells us that we're going too fast, `slow_down`
+    halves the rate, after which every successful request
+    gradually restores it to the configured rate.
+    """
+
+    def __init__(self, qps=10, burst=10, floor=0.1, recovery=0.05):
+        self.lock = threading.Lock()
+        self.qps = self.rate = qps
+        self.burst = self.tokens = burst
+        self.floor = floor
+        self.recovery = recovery
+        self.timestamp = clock()
+
+    def configure(self, qps=None, burst=None):
+        with self.lock:
+            if qps:
+                self.qps = self.rate = qps
+            if burst:
+                self.burst = burst
+                self.tokens = min(self.tokens, burst)
+
+    def reserve(self, tokens=1):
+        """
+        Take out one or more tokens and return how many seconds
+        to wait before they may be used.
+        """
+
+        with self.lock:
+            now = clock()
+            elapsed = now - self.timestamp
+            self.timestamp = now
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.tokens = self.tokens - tokens
+            if self.tokens >= 0:
+                return 0
+            else:
+                return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        time.sleep(wait)
+        return wait
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.floor, self.rate / 2.0)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.qps, self.rate + self.qps * self.recovery)
+
+    def __repr__(self):
+        return "<googleanalytics.utils.ratelimit.TokenBucket object: {rate:.2f}/{qps} qps>".format(
+            rate=self.rate, qps=self.qps)
+
+
+DEFAULTS = {
+    'qps': 10,
+    'burst': 10,
+}
+
+buckets = {}
+lock = threading.Lock()
+
+
+def limiter(*key):
+    """ Return the token bucket for a key, e.g. a credential identity and profile id. """
+    with lock:
+        if key not in buckets:
+            buckets[key] = TokenBucket(**DEFAULTS)
+        return buckets[key]
+
+
+def configure(*key, **options):
+    """
+    Set the `qps` and `burst` for a single key or, when no key is
+    given, for every key including those we haven't seen yet.
+    """
+
+    if key:
+        limiter(*key).configure(**options)
+    else:
+        with lock:
+            DEFAULTS.update(options)
+            for bucket in buckets.values():
+                bucket.configure(**options)
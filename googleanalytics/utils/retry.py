@@ -0,0 +1,77 @@
+# encoding: utf-8
+
+"""
+Retries with jittered exponential backoff, for errors that are
+likely to go away on their own: rate limits and server errors.
+
+Every request is tried again at most `retries` times, and all requests
+that are part of a single run -- by default, every page and shard
+fetched by one call to `get`, `iter_rows` or `batch` -- together
+retry at most `budget` times, so a run against an API that is down
+gives up soon enough.
+
+```python
+# change the defaults
+ga.utils.retry.configure(retries=3, budget=10)
+# or for a single query
+query.retry(retries=10)
+# share a budget between runs, e.g. for all queries in a blueprint
+budget = ga.utils.retry.Budget(50)
+queries = [query.retry(budget=budget) for query in blueprint.queries(profile)]
+```
+"""
+
+import random
+import threading
+
+
+class Budget(object):
+    """ A number of retries that can be shared between queries and threads. """
+
+    def __init__(self, retries):
+        self.lock = threading.Lock()
+        self.remaining = retries
+
+    def spend(self):
+        """ Take out a retry, or return `False` if there are none left. """
+        with self.lock:
+            if self.remaining > 0:
+                self.remaining = self.remaining - 1
+                return True
+            else:
+                return False
+
+    # queries are copied whenever they're refined or paginated,
+    # but copies of a query should keep drawing from the same budget
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return "<googleanalytics.utils.retry.Budget object: {} retries left>".format(self.remaining)
+
+
+DEFAULTS = {
+    'retries': 5,
+    'budget': 20,
+    # in seconds
+    'base': 1,
+    'cap': 32,
+}
+
+
+def backoff(attempt):
+    """
+    How long to wait before trying again, after `attempt` earlier
+    retries: a random amount of time up to an exponentially growing
+    maximum, so that clients that failed together don't all
+    come back at the same time.
+    """
+    return random.uniform(0, min(DEFAULTS['cap'], DEFAULTS['base'] * 2 ** attempt))
+
+
+def configure(**options):
+    """ Set the default `retries`, `budget`, `base` and `cap`. """
+    DEFAULTS.update(options)
@@ -0,0 +1,205 @@
+# encoding: utf-8
+
+"""
+Writers that stream a report to a file-like object, one page at
+a time, so results can be written as their pages arrive rather
+than after the whole report has been built:
+
+```python
+with open('pageviews.parquet', 'wb') as f:
+    query.write(f, 'parquet')
+
+with open('pageviews.ndjson', 'w') as f:
+    query.write(f, 'ndjson')
+```
+
+`csv` writes a header and then a chunk of rows for every page and
+`ndjson` a JSON object for every row, with dates in ISO 8601 format.
+Both write text, and encode it to UTF-8 for binary file-like objects.
+
+`arrow` and `parquet` require `pyarrow` and write every page as a
+record batch. The schema follows from the columns of the report:
+integer and float columns become `int64` and `float64`, `ga:date`
+becomes `date32`, `ga:dateHour` a timestamp and anything else a
+string. Field names are the Python slugs of the columns, like
+`page_path`, and the metadata of every field includes the column
+id, like `ga:pagePath`.
+"""
+
+import array
+import codecs
+import collections
+import csv
+import io
+import json
+
+from . import storage, utils
+
+
+def field(column):
+    import pyarrow
+
+    if column.id == 'ga:date':
+        type = pyarrow.date32()
+    elif column.id == 'ga:dateHour':
+        type = pyarrow.timestamp('s')
+    elif column.cast is int:
+        type = pyarrow.int64()
+    elif column.cast is float:
+        type = pyarrow.float64()
+    else:
+        type = pyarrow.string()
+
+    return pyarrow.field(column.python_slug, type, metadata={'id': column.id})
+
+
+def schema(columns):
+    import pyarrow
+    return pyarrow.schema([field(column) for column in columns])
+
+
+def batch(report, schema):
+    """ A record batch with the data in a report, without copying numeric columns. """
+
+    import pyarrow
+
+    arrays = []
+    for field, store in zip(schema, report.data):
+        if storage.typecode(store) and store.itemsize == field.type.bit_width // 8:
+            buffer = pyarrow.py_buffer(store)
+            arrays.append(pyarrow.Array.from_buffers(field.type, len(store), [None, buffer]))
+        else:
+            arrays.append(pyarrow.array(list(store), type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class Writer(object):
+    """ Write the pages of a report to a file-like object as they arrive. """
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def write(self, report):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextWriter(Writer):
+    """ Write text, encoded to UTF-8 unless the sink takes text. """
+
+    def __init__(self, sink):
+        if isinstance(sink, io.TextIOBase):
+            self.sink = sink
+        else:
+            self.sink = codecs.getwriter('utf-8')(sink)
+        self.started = False
+
+    def write(self, report):
+        if not self.started:
+            self.start(report)
+            self.started = True
+        self.write_rows(report)
+        self.sink.flush()
+
+    def start(self, report):
+        pass
+
+    def write_rows(self, report):
+        raise NotImplementedError()
+
+
+class CSVWriter(TextWriter):
+    """ CSV with a header row, written a page at a time. """
+
+    def start(self, report):
+        self.writer = csv.writer(self.sink)
+        report._resolve(strict=False)
+        self.writer.writerow([column.name for column in report.columns])
+
+    def write_rows(self, report):
+        self.writer.writerows(report.rows)
+
+
+class NDJSONWriter(TextWriter):
+    """ Newline-delimited JSON, with an object for every row. """
+
+    def start(self, report):
+        self.keys = report.Row._fields
+
+    def write_rows(self, report):
+        for row in zip(*report.data):
+            values = [utils.date.serialize(value) for value in row]
+            line = json.dumps(collections.OrderedDict(zip(self.keys, values)))
+            self.sink.write(utils.unicode(line) + u'\n')
+
+
+class RecordBatchWriter(Writer):
+    """ Write a record batch for every page. The schema is taken from the first page. """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.schema = None
+        self.writer = None
+
+    def open(self, schema):
+        raise NotImplementedError()
+
+    def write_batch(self, batch):
+        raise NotImplementedError()
+
+    def write(self, report):
+        if self.writer is None:
+            self.schema = schema(report.columns)
+            self.writer = self.open(self.schema)
+        self.write_batch(batch(report, self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ArrowWriter(RecordBatchWriter):
+    """ An Arrow IPC stream, with a record batch per page. """
+
+    def open(self, schema):
+        import pyarrow.ipc
+        return pyarrow.ipc.new_stream(self.sink, schema)
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+
+class ParquetWriter(RecordBatchWriter):
+    """ A Parquet file, with a row group per page. """
+
+    def open(self, schema):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.sink, schema)
+
+    def write_batch(self, batch):
+        import pyarrow
+        self.writer.write_table(pyarrow.Table.from_batches([batch]))
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'ndjson': NDJSONWriter,
+    'arrow': ArrowWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def writer(format, sink):
+    try:
+        return WRITERS[format](sink)
+    except KeyError:
+        raise ValueError("Unknown format: {}. Choose from: {}".format(
+            format, ', '.join(sorted(WRITERS))))